@@ -1,26 +1,29 @@
 import sys
-import os
-from recombee_api_client.api_client import RecombeeClient, Region
 from recombee_api_client.exceptions import ResponseException
 from recombee_api_client.api_requests import AddUser
 from recombee_api_client.api_requests import (
     SearchItems,
     RecommendItemsToItem,
     RecommendItemsToUser,
-    AddRating,
     SetUserValues,
-    GetItemValues,
     GetUserValues,
-    AddDetailView
 )
 
+import autocomplete
+from event_queue import shared_queue
+from item_cache import get_many_item_values, shared_cache
+import popularity
+from recombee_client import make_client
+import search_index
+import similarity
+
 # ================= CONFIG =================
 
-client = RecombeeClient(
-        os.environ["RECOMBEE_DB_ID"],
-        os.environ["RECOMBEE_API_TOKEN"],
-        region=Region[os.environ.get("RECOMBEE_REGION", "EU_WEST")],
-)
+client = make_client()
+item_cache = shared_cache()
+events = shared_queue(client)  # vizite / rating-uri, trimise in fundal
+SEARCH_MODE = search_index.mode_from_env()
+SIMILAR_MODE = similarity.mode_from_env()
 
 # ============= HELPERI GENERALI ==============
 def ensure_user(user_id: str):
@@ -64,20 +67,32 @@ def init_user_profile(user_id: str):
     print("\nHai să-ți configurăm rapid profilul inițial.")
     print("Spune-mi până la 3 cărți care ți-au plăcut.\n")
 
-    fav_genres = set()
-    fav_authors = set()
-
+    picks = []
     for idx in range(1, 4):
         prompt = f"Cartea #{idx} (caută după titlu sau ENTER pentru a sări): "
         item_id = search_and_choose_book(user_id, prompt)
         if item_id is None:
             # userul a dat direct ENTER sau 0
             break
+        picks.append(item_id)
 
-        try:
-            values = client.send(GetItemValues(item_id))
-        except Exception as e:
-            print(f"Nu am putut citi detaliile pentru {item_id}: {e}")
+        # valorile tocmai afisate in cautare sunt deja in cache
+        shown = item_cache.get(item_id)
+        print(f"Am adăugat în profil cartea: {format_book(shown) if shown else item_id}\n")
+
+    # ce nu e in cache vine intr-un singur Batch, nu cate un GetItemValues per carte
+    try:
+        values_by_id = get_many_item_values(client.send, picks, item_cache)
+    except Exception as e:
+        print(f"Nu am putut citi detaliile cărților alese: {e}")
+        values_by_id = {}
+
+    fav_genres = set()
+    fav_authors = set()
+    for item_id in picks:
+        values = values_by_id.get(item_id)
+        if values is None:
+            print(f"Nu am putut citi detaliile pentru {item_id}.")
             continue
 
         author = values.get("author")
@@ -89,8 +104,6 @@ def init_user_profile(user_id: str):
         if isinstance(genres, list):
             fav_genres.update(genres)
 
-        print(f"Am adăugat în profil cartea: {format_book(values)}\n")
-
     if not fav_genres and not fav_authors:
         print("Nu ai ales nicio carte, sar peste profilul inițial.\n")
         return
@@ -129,7 +142,8 @@ def format_book(values: dict) -> str:
 
 def search_and_choose_book(user_id: str, context_text: str, personalized: bool = True) -> str | None:
     """
-    Folosește SearchItems în Recombee:
+    Caută în indexul local (search_index) și/sau cu SearchItems în Recombee,
+    după SEARCH_MODE:
       - userul scrie o bucățică de titlu
       - afișăm top 5 rezultate
       - alege un număr (1-5)
@@ -140,27 +154,38 @@ def search_and_choose_book(user_id: str, context_text: str, personalized: bool =
         if not query:
             return None
 
+        def remote(q, count):
+            return client.send(SearchItems(user_id, q, count, return_properties=True))
+
         try:
-            resp = client.send(
-                SearchItems(
-                    user_id,
-                    query,
-                    5,
-                    return_properties=True,
-                )
-            )
+            index = search_index.shared_index(wait=False)  # None cât încă se construiește
+            resp = search_index.search(index, query, 5, mode=SEARCH_MODE, remote=remote)
         except Exception as e:
             print(f"Eroare la SearchItems: {e}")
             return None
 
+        item_cache.put_recomms(resp)
         recomms = resp.get("recomms", [])
-        if not recomms:
+        # sugestii pentru titluri scrise greșit, din trie-ul local (fără rețea)
+        trie = autocomplete.shared_trie(wait=False)
+        found = {rec["id"] for rec in recomms}
+        suggestions = [
+            s for s in (trie.suggest(query) if trie is not None else [])
+            if s["distance"] > 0 and s["id"] not in found
+        ][:3]
+        if not recomms and not suggestions:
             print("Nu am găsit cărți pentru acest titlu. Încearcă altceva.\n")
             continue
 
-        print("\nRezultate:")
+        if recomms:
+            print("\nRezultate:")
         for idx, rec in enumerate(recomms, start=1):
             print(f"{idx}) {format_book(rec.get('values', {}))}")
+        if suggestions:
+            print("\nAi vrut să spui:")
+            for idx, sug in enumerate(suggestions, start=len(recomms) + 1):
+                print(f"{idx}) {autocomplete.suggestion_label(sug)}")
+            recomms = recomms + [{"id": sug["id"]} for sug in suggestions]
 
         print("0) Înapoi")
         choice = input("Alege numărul cărții: ").strip()
@@ -177,17 +202,8 @@ def search_and_choose_book(user_id: str, context_text: str, personalized: bool =
         if 1 <= idx <= len(recomms):
             item_id = recomms[idx - 1]["id"]
 
-            # 🔹 aici marcăm vizita în Recombee
-            try:
-                client.send(
-                    AddDetailView(
-                        user_id,
-                        item_id,
-                        cascade_create=True
-                    )
-                )
-            except Exception as e:
-                print(f"Avertisment: nu am putut înregistra vizita: {e}")
+            # 🔹 aici marcăm vizita în Recombee (in fundal, fara sa asteptam raspunsul)
+            events.add_detail_view(user_id, item_id)
 
             return item_id
 
@@ -232,7 +248,7 @@ def action_rate_book(user_id: str):
             continue
         break
     r = (rating - 3) / 2  # convertim la -1..1
-    client.send(AddRating(user_id, item_id, r, cascade_create=True))
+    events.add_rating(user_id, item_id, r)
     print(f"\nRating salvat: userul {user_id} a dat {rating} la {item_id}\n")
 
 
@@ -249,36 +265,85 @@ def action_recommend_for_user(user_id: str):
         )
     except Exception as e:
         print(f"Eroare la RecommendItemsToUser: {e}")
+        print_popular_fallback(user_id)
         return
 
-
+    item_cache.put_recomms(resp)
     recomms = resp.get("recomms", [])
     print(f"\nRecomandări pentru {user_id}:")
     if not recomms:
         print("Nu există încă destule informații. Dă întâi câteva ratinguri.\n")
+        print_popular_fallback(user_id)
         return
 
     print_recommendations_list(recomms)
 
 
+def print_popular_fallback(user_id: str):
+    """
+    Fără recomandări personalizate: cele mai apreciate cărți din genurile
+    preferate ale userului (fav_genres), altfel din tot catalogul.
+    """
+    ranker = popularity.shared_ranker(wait=False)
+    if ranker is None:
+        return
+    try:
+        genres = client.send(GetUserValues(user_id)).get("fav_genres") or []
+    except Exception:
+        genres = []  # fără profil / Recombee indisponibil: clasamentul global
+    print("Până atunci, cele mai apreciate cărți" + (" din genurile tale:" if genres else ":"))
+    print_recommendations_list(popularity.popular_for_genres(ranker, genres, 10)["recomms"])
+
+
+def action_popular_in_genre(user_id: str):
+    """Cele mai apreciate cărți dintr-un gen, fără niciun apel la Recombee."""
+    ranker = popularity.shared_ranker()
+    if ranker is None:
+        print("Clasamentul local nu e disponibil (lipsește catalogul CSV).\n")
+        return
+
+    genres = ranker.genres()
+    shown = genres[:15]
+    for idx, genre in enumerate(shown, start=1):
+        print(f"{idx}) {genre}")
+    print("0) Înapoi")
+    choice = input("Alege numărul genului sau scrie alt gen: ").strip()
+    if not choice or choice == "0":
+        return
+    if choice.isdigit() and 1 <= int(choice) <= len(shown):
+        genre = shown[int(choice) - 1]
+    else:
+        # potrivire fără majuscule / diacritice, peste toate genurile
+        by_key = {search_index.fold(g): g for g in genres}
+        genre = by_key.get(search_index.fold(choice))
+        if genre is None:
+            print("Gen necunoscut.\n")
+            return
+
+    resp = popularity.popular(ranker, 10, genre=genre)
+    item_cache.put_recomms(resp)
+    print(f"\nPopulare în {genre}:")
+    print_recommendations_list(resp["recomms"])
+
+
 def action_similar_books(user_id: str):
     item_id = search_and_choose_book(user_id, "Introdu titlul unei cărți pentru a vedea alte cărți asemănătoare")
     if item_id is None:
         return
 
+    def remote(i, count):
+        return client.send(RecommendItemsToItem(i, user_id, count, return_properties=True))
+
     try:
-        resp = client.send(
-            RecommendItemsToItem(
-                item_id,
-                user_id,
-                10,
-                return_properties=True,
-            )
-        )
+        # tabela locală de vecini (similarity); cât încă se construiește, candidații
+        # vin din indexul ANN peste descrieri; RecommendItemsToItem după SIMILAR_MODE
+        local = None if SIMILAR_MODE == "remote" else similarity.local_source()
+        resp = similarity.recommend(local, item_id, 10, mode=SIMILAR_MODE, remote=remote)
     except Exception as e:
         print(f"Eroare la RecommendItemsToItem: {e}")
         return
 
+    item_cache.put_recomms(resp)
     recomms = resp.get("recomms", [])
     print("\nCărți similare cu ce ai ales:")
     if not recomms:
@@ -298,6 +363,12 @@ def main():
         sys.exit(0)
 
     print(f"\nBun venit, {user_id}!\n")
+    if SEARCH_MODE != "remote":
+        search_index.shared_index(wait=False)  # construim indexul cât userul scrie
+    autocomplete.shared_trie(wait=False)
+    if SIMILAR_MODE != "remote":
+        similarity.shared_table(wait=False)
+    popularity.shared_ranker(wait=False)
 
     ensure_user(user_id)
 
@@ -315,6 +386,7 @@ def main():
         print("2) Dă rating unei cărți")
         print("3) Recomandări pentru mine")
         print("4) Cărți similare cu o carte")
+        print("5) Populare într-un gen")
         print("0) Ieșire")
 
         choice = input("Alege opțiunea: ").strip()
@@ -328,8 +400,11 @@ def main():
             action_recommend_for_user(user_id)
         elif choice == "4":
             action_similar_books(user_id)
+        elif choice == "5":
+            action_popular_in_genre(user_id)
         elif choice == "0":
             print("La revedere!")
+            events.close()  # trimitem vizitele / rating-urile ramase
             break
         else:
             print("Opțiune invalidă. Încearcă din nou.\n")
@@ -0,0 +1,272 @@
+"""
+Autocomplete tolerant la greseli pentru titluri si autori.
+
+Un trie compact peste cheile normalizate (search_index.fold), tinut in
+array-uri numpy in loc de dict-uri: nodurile sunt numerotate in preordine,
+deci subarborele nodului n ocupa intervalul [n, end[n]), primul copil e
+n + 1, iar fratele urmator al unui copil c e end[c]. Cheile sunt sortate,
+asa ca si cheile de sub un nod formeaza un interval contiguu.
+
+Chei per carte: titlul intreg, titlul de la al doilea / al treilea cuvant
+("hunger games" gaseste "The Hunger Games"), autorul si numele lui de
+familie, toate taiate la MAX_KEY_LEN caractere.
+
+    trie = TitleTrie.from_catalog()
+    trie.suggest("hungr gam")   # [{"id", "title", "author", "distance"}, ...]
+
+suggest() cauta intai prefixul exact (zeci de microsecunde); doar daca nu
+exista, parcurge trie-ul cu distanta de editare marginita: intai 1 greseala
+(~1 ms), apoi 2 pentru interogarile de cel putin 8 caractere. Sub 4
+caractere nu corectam nimic.
+"""
+from array import array
+
+import numpy as np
+
+from background import BackgroundSingleton
+from catalog import ROLE_RE
+from search_index import tokenize
+
+MAX_KEY_LEN = 32
+TITLE_STARTS = 3  # din cate pozitii de cuvant indexam titlul
+RANGE_SORT_LIMIT = 256  # peste atatea chei, top-ul unui nod e memorat
+
+
+def max_distance(query: str) -> int:
+    if len(query) < 4:
+        return 0
+    return 1 if len(query) < 8 else 2
+
+
+def normalize(text) -> str:
+    return " ".join(tokenize(text))
+
+
+class TitleTrie:
+    def __init__(self, item_ids: list, titles: list, authors: list, popularity=None):
+        self.item_ids = list(item_ids)
+        self.titles = list(titles)
+        self.authors = list(authors)
+        n = len(self.item_ids)
+        pop = np.zeros(n) if popularity is None else np.nan_to_num(np.asarray(popularity, dtype=np.float64))
+        self.popularity = pop
+
+        # cheie -> cartile ei
+        books_of = {}
+        for book, (title, author) in enumerate(zip(self.titles, self.authors)):
+            words = tokenize(title)
+            for start in range(min(TITLE_STARTS, len(words))):
+                books_of.setdefault(" ".join(words[start:])[:MAX_KEY_LEN], []).append(book)
+            for name in ROLE_RE.sub(" ", str(author or "")).split(","):
+                words = tokenize(name)
+                if words:
+                    books_of.setdefault(" ".join(words)[:MAX_KEY_LEN], []).append(book)
+                    books_of.setdefault(words[-1][:MAX_KEY_LEN], []).append(book)
+        books_of.pop("", None)
+
+        self.keys = sorted(books_of)
+        # CSR: cartile fiecarei chei, cele mai populare primele
+        indptr = [0]
+        books = []
+        for key in self.keys:
+            ids = sorted(set(books_of[key]), key=lambda b: -pop[b])
+            books.extend(ids)
+            indptr.append(len(books))
+        self.key_indptr = np.array(indptr, dtype=np.int64)
+        self.key_books = np.array(books, dtype=np.int32)
+        self.key_score = pop[self.key_books[self.key_indptr[:-1]]] if self.keys else np.zeros(0)
+
+        # trie in preordine, construit din cheile sortate
+        labels = [0]  # radacina
+        key_lo = [0]
+        parent_stack = [0]  # nodurile de pe drumul cheii anterioare
+        ends = {}
+        prev = ""
+        for key_id, key in enumerate(self.keys):
+            common = 0
+            while common < min(len(prev), len(key)) and prev[common] == key[common]:
+                common += 1
+            # nodurile de dupa prefixul comun s-au incheiat
+            while len(parent_stack) > common + 1:
+                ends[parent_stack.pop()] = len(labels)
+            for ch in key[common:]:
+                parent_stack.append(len(labels))
+                labels.append(ord(ch))
+                key_lo.append(key_id)
+            prev = key
+        while parent_stack:
+            ends[parent_stack.pop()] = len(labels)
+
+        # array.array: compact ca numpy, dar indexarea scalara intoarce direct int-uri Python
+        self.labels = array("I", labels)
+        self.end = array("i", [ends[i] for i in range(len(labels))])
+        self.key_lo = array("i", key_lo + [len(self.keys)])  # +1: santinela pentru end
+        self._top_cache = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_frame(cls, df) -> "TitleTrie":
+        df = df.drop_duplicates("bookId")
+        return cls(
+            df["bookId"].astype(str).tolist(),
+            df["title"].astype(object).where(df["title"].notna(), "").tolist(),
+            df["author"].astype(object).where(df["author"].notna(), "").tolist(),
+            df["numRatings"].to_numpy(dtype="float64", na_value=0),
+        )
+
+    @classmethod
+    def from_catalog(cls, path: str | None = None) -> "TitleTrie":
+        import catalog
+
+        return cls.from_frame(catalog.load_catalog(path or catalog.CSV_PATH))
+
+    # ---------- navigare ----------
+
+    def _children(self, node: int):
+        child = node + 1
+        end = self.end[node]
+        while child < end:
+            yield child
+            child = self.end[child]
+
+    def find(self, prefix: str) -> int | None:
+        """Nodul prefixului exact sau None."""
+        node = 0
+        for ch in prefix:
+            code = ord(ch)
+            for child in self._children(node):
+                if self.labels[child] == code:
+                    node = child
+                    break
+            else:
+                return None
+        return node
+
+    def _key_range(self, node: int) -> tuple[int, int]:
+        return self.key_lo[node], self.key_lo[self.end[node]]
+
+    def _top_keys(self, node: int, k: int) -> list:
+        """Cele mai bune k chei (dupa popularitatea primei carti) de sub nod."""
+        lo, hi = self._key_range(node)
+        if hi - lo <= RANGE_SORT_LIMIT:
+            return (lo + np.argsort(-self.key_score[lo:hi], kind="stable")[:k]).tolist()
+        cached = self._top_cache.get(node)
+        if cached is None or len(cached) < k:
+            scores = self.key_score[lo:hi]
+            top = np.argpartition(-scores, min(k, hi - lo) - 1)[:k]
+            cached = self._top_cache[node] = (lo + top[np.argsort(-scores[top], kind="stable")]).tolist()
+        return cached[:k]
+
+    def fuzzy_nodes(self, query: str, max_dist: int) -> list:
+        """
+        [(distanta, nod)]: nodurile al caror prefix e la cel mult `max_dist`
+        editari de query; tot subarborele lor se potriveste ca prefix.
+
+        Distanta e Damerau-Levenshtein restransa (o inversare de litere
+        vecine, "tolkein", costa 1) si se calculeaza doar pe banda
+        |i - j| <= max_dist a matricei. Prima litera trebuie sa fie corecta:
+        greselile acolo sunt rare, iar fara ancora asta am parcurge o buna
+        parte din trie.
+        """
+        labels, end = self.labels, self.end
+        n = len(query)
+        big = max_dist + 1
+        out = []
+        start = self.find(query[0])
+        if start is None:
+            return out
+        # (nod, adancime, randul lui, randul parintelui)
+        first = [min(j, big) for j in range(-1, n)]
+        first[0] = 1
+        stack = [(start, 1, first, None)]
+        while stack:
+            node, depth, row, up_row = stack.pop()
+            best = min(row)
+            if row[n] <= max_dist:
+                out.append((row[n], node))
+            if best > max_dist or best >= row[n]:
+                continue  # mai jos nu se mai poate obtine o distanta mai mica
+            i = depth + 1
+            lo = max(1, i - max_dist)
+            hi = min(n, i + max_dist)
+            prev_ch = chr(labels[node])
+            child = node + 1
+            stop = end[node]
+            while child < stop:
+                ch = chr(labels[child])
+                cur = [big] * (n + 1)
+                if i <= max_dist:
+                    cur[0] = i
+                for j in range(lo, hi + 1):
+                    qc = query[j - 1]
+                    d = row[j - 1] if qc == ch else row[j - 1] + 1
+                    if cur[j - 1] + 1 < d:
+                        d = cur[j - 1] + 1
+                    if row[j] + 1 < d:
+                        d = row[j] + 1
+                    if j > 1 and up_row is not None and qc == prev_ch and query[j - 2] == ch and up_row[j - 2] + 1 < d:
+                        d = up_row[j - 2] + 1  # inversare
+                    cur[j] = d if d < big else big
+                stack.append((child, i, cur, row))
+                child = end[child]
+        return out
+
+    # ---------- sugestii ----------
+
+    def suggest(self, query: str, k: int = 5, max_dist: int | None = None) -> list:
+        q = normalize(query)[:MAX_KEY_LEN]
+        if not q:
+            return []
+        max_dist = max_distance(q) if max_dist is None else max_dist
+
+        node = self.find(q)
+        matches = [(0, node)] if node is not None else []
+        # o greseala e cazul obisnuit si mult mai ieftin de cautat: abia apoi doua
+        for dist in range(1, max_dist + 1):
+            if matches:
+                break
+            matches = sorted(self.fuzzy_nodes(q, dist), key=lambda m: m[0])
+
+        out = []
+        seen = set()
+        for book, dist in self._books_of(matches, k):
+            if book in seen:
+                continue
+            seen.add(book)
+            out.append({
+                "id": self.item_ids[book],
+                "title": self.titles[book],
+                "author": self.authors[book],
+                "distance": dist,
+            })
+            if len(out) == k:
+                break
+        return out
+
+    def _books_of(self, matches: list, k: int) -> list:
+        """(carte, distanta), la distanta egala dupa popularitate."""
+        candidates = []
+        for dist, node in matches:
+            for key_id in self._top_keys(node, k):
+                lo, hi = self.key_indptr[key_id], self.key_indptr[key_id + 1]
+                for book in self.key_books[lo:min(hi, lo + k)]:
+                    candidates.append((dist, -self.popularity[book], int(book)))
+        candidates.sort()
+        return [(book, dist) for dist, _, book in candidates]
+
+
+# ---------- trie-ul procesului ----------
+
+_shared = BackgroundSingleton(TitleTrie.from_catalog, "autocomplete")
+
+
+def shared_trie(wait: bool = True) -> TitleTrie | None:
+    """Trie-ul procesului (~4 s de construit); pana e gata, cautarile nu au sugestii."""
+    return _shared.get(wait)
+
+
+def suggestion_label(s: dict) -> str:
+    author = ROLE_RE.sub("", str(s.get("author") or "")).split(",")[0].strip()
+    return f"{s['title']} — {author}" if author else str(s["title"])
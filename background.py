@@ -0,0 +1,46 @@
+"""
+Obiecte construite o data per proces, intr-un thread din fundal: indexul
+de cautare, trie-ul, tabela de similare, indexul ANN, clasamentul.
+
+    _shared = BackgroundSingleton(SearchIndex.from_catalog, "search-index")
+    _shared.get(wait=False)   # porneste constructia; None pana e gata
+    _shared.get()             # asteapta
+
+Daca constructia esueaza (ex. lipseste catalogul local), get() intoarce
+None pentru tot procesul, iar exceptia ramane in `error`.
+"""
+import threading
+
+
+class BackgroundSingleton:
+    def __init__(self, build, name: str):
+        self._build = build
+        self.name = name
+        self.value = None
+        self.error = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def get(self, wait: bool = True):
+        self.start()
+        if wait:
+            self._ready.wait()
+        return self.value if self._ready.is_set() else None
+
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def _run(self):
+        try:
+            self.value = self._build()
+        except Exception as e:
+            self.error = e
+        finally:
+            self._ready.set()
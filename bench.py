@@ -0,0 +1,447 @@
+"""
+Benchmark-uri locale pentru pipeline-ul de ingestie si pentru cautare.
+
+    python bench.py transform    # iterrows vs conversie pe coloane
+    python bench.py requests     # AddItem+SetItemValues vs doar SetItemValues
+    python bench.py dates        # pd.to_datetime vs catalog.parse_year (+ verificare)
+    python bench.py ingest       # loader complet pe stand-in, CSV x1/x10/x50 -> JSON
+    python bench.py search       # index local vs SearchItems: latenta + recall@5
+    python bench.py ann          # IVF peste descrieri vs cautare exacta: recall@10 + QPS
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+import numpy as np
+
+import pandas as pd
+
+import ann_index
+import catalog
+import load_books
+import search_index
+from load_books import safe_float, safe_int
+from local_recombee import LocalRecombee
+from recombee_api_client.api_requests import Batch, SearchItems
+
+
+def legacy_props(df: pd.DataFrame) -> list:
+    """Bucla originala din load_books.main() (df.iterrows), pastrata ca referinta."""
+    out = []
+    for _, row in df.iterrows():
+        item_id = str(row["bookId"])
+
+        if pd.notna(row.get("genres")):
+            genres = str(row["genres"]).split("|")
+        else:
+            genres = []
+
+        has_awards = (
+            pd.notna(row.get("awards"))
+            and str(row["awards"]).strip() != ""
+        )
+
+        props = {
+            "title": row["title"],
+            "author": row["author"],
+            "series": row["series"] if pd.notna(row.get("series")) else None,
+            "genres": genres,
+            "language": row["language"] if pd.notna(row.get("language")) else None,
+            "book_format": row["bookFormat"] if pd.notna(row.get("bookFormat")) else None,
+            "publisher": row["publisher"] if pd.notna(row.get("publisher")) else None,
+            "description": row["description"] if pd.notna(row.get("description")) else "",
+            "pages": safe_int(row.get("pages")),
+            "avg_rating": safe_float(row.get("rating")),
+            "num_ratings": safe_int(row.get("numRatings")),
+            "liked_percent": safe_float(row.get("likedPercent")),
+            "bbe_score": safe_float(row.get("bbeScore")),
+            "bbe_votes": safe_int(row.get("bbeVotes")),
+            "price": safe_float(row.get("price")),
+            "publish_year": safe_int(row.get("publish_year")),
+            "description_len": safe_int(row.get("description_len")),
+            "popularity": safe_float(row.get("popularity")),
+            "has_awards": bool(has_awards),
+        }
+        out.append((item_id, props))
+    return out
+
+
+# campuri corectate intre timp (genres era impartit pe '|', "[]" conta ca premiu);
+# nu le mai comparam cu bucla veche
+_FIXED_FIELDS = {"genres", "has_awards"}
+
+
+def _same(a, b) -> bool:
+    # bucla veche lasa NaN acolo unde varianta noua pune None
+    if isinstance(a, float) and math.isnan(a):
+        return b is None
+    return a == b
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - t0
+
+
+def bench_transform(args):
+    df = catalog.add_derived_columns(pd.read_csv(args.csv))
+    if args.scale > 1:
+        df = pd.concat([df] * args.scale, ignore_index=True)
+
+    old, t_old = timed(legacy_props, df)
+    new, t_new = timed(lambda d: list(load_books.iter_props(catalog.clean_columns(d))), df.copy())
+
+    mismatches = 0
+    for (id_a, pa), (id_b, pb) in zip(old, new):
+        if id_a != id_b or any(not _same(pa[k], pb[k]) for k in pa if k not in _FIXED_FIELDS):
+            mismatches += 1
+
+    print(f"rows:        {len(df)}")
+    print(f"iterrows:    {t_old:8.3f} s  ({len(df) / t_old:10.0f} rows/s)")
+    print(f"columnar:    {t_new:8.3f} s  ({len(df) / t_new:10.0f} rows/s)")
+    print(f"speedup:     {t_old / t_new:8.1f}x")
+    print(f"mismatches:  {mismatches}")
+
+
+def run_loader(client, *flags, csv=catalog.CSV_PATH):
+    """Ruleaza load_books.run() cu un client dat, fara checkpoint/dead letter in cwd."""
+    with tempfile.TemporaryDirectory() as tmp:
+        argv = ["--csv", csv, "--checkpoint", "",
+                "--dead-letter", os.path.join(tmp, "dead_letter.jsonl"), *flags]
+        args = load_books.build_parser().parse_args(argv)
+        t0 = time.perf_counter()
+        load_books.run(args, client)
+        return time.perf_counter() - t0
+
+
+def bench_requests(args):
+    for label, flags in [("AddItem + SetItemValues", ["--add-item", "--batch-size", "250"]),
+                         ("SetItemValues (cascade)", [])]:
+        client = LocalRecombee(latency_ms=args.rtt_ms, per_request_ms=args.per_request_ms)
+        wall = run_loader(client, *flags, csv=args.csv)
+        send = sum(client.latencies)
+        print(f"{label:26s} batches={client.batches:5d}  sub-requests={client.requests:7d}  "
+              f"send={send:6.2f} s  wall={wall:6.2f} s")
+
+
+def bench_dates(args):
+    """publish_year din catalog.parse_year trebuie sa fie identic cu pd.to_datetime."""
+    df = pd.read_csv(args.csv, usecols=["firstPublishDate", "publishDate"], dtype=str)
+    if args.scale > 1:
+        df = pd.concat([df] * args.scale, ignore_index=True)
+
+    def old(d):
+        return pd.to_datetime(d["firstPublishDate"], errors="coerce").dt.year.fillna(
+            pd.to_datetime(d["publishDate"], errors="coerce").dt.year
+        )
+
+    def new(d):
+        catalog._YEAR_CACHE.clear()  # fara memo cald din rulari anterioare
+        return catalog.parse_year(d["firstPublishDate"]).fillna(catalog.parse_year(d["publishDate"]))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # "Could not infer format" de la pandas
+        ref, t_old = timed(old, df)
+    got, t_new = timed(new, df)
+
+    same = (ref == got) | (ref.isna() & got.isna())
+    print(f"rows:        {len(df)}")
+    print(f"to_datetime: {t_old:8.3f} s")
+    print(f"parse_year:  {t_new:8.3f} s")
+    print(f"speedup:     {t_old / t_new:8.1f}x")
+    print(f"mismatches:  {int((~same).sum())}")
+    if not same.all():
+        raise SystemExit(1)
+
+
+# ---------- ingest: benchmark complet, un subproces per scala ----------
+
+def write_scaled_csv(src: str, dst: str, scale: int, chunksize: int = 20000):
+    """Copie a CSV-ului (doar coloanele folosite) repetata de `scale` ori, cu bookId-uri unice."""
+    first = True
+    for k in range(scale):
+        for df in pd.read_csv(src, usecols=catalog._is_used_column, dtype=str, chunksize=chunksize):
+            if k:
+                df["bookId"] = df["bookId"] + f"~{k}"
+            df.to_csv(dst, mode="w" if first else "a", header=first, index=False)
+            first = False
+
+
+def _stage_cpu(csv: str, chunksize: int, batch_size: int) -> dict:
+    """CPU (process_time) pentru parse / transform / serialize, masurate separat, fara trimitere."""
+    cpu = {"parse": 0.0, "transform": 0.0, "serialize": 0.0}
+    rows = 0
+    frames = catalog.iter_frames(csv, chunksize=chunksize)
+    while True:
+        t0 = time.process_time()
+        df = next(frames, None)
+        cpu["parse"] += time.process_time() - t0
+        if df is None:
+            return rows, cpu
+        rows += len(df)
+
+        t0 = time.process_time()
+        reqs = [r for _, book in load_books.iter_book_requests(df) for r in book]
+        cpu["transform"] += time.process_time() - t0
+
+        t0 = time.process_time()
+        for i in range(0, len(reqs), batch_size):
+            json.dumps(Batch(reqs[i:i + batch_size]).get_body_parameters())
+        cpu["serialize"] += time.process_time() - t0
+
+
+def bench_ingest_one(args):
+    """
+    Ruleaza in subproces: loader-ul complet pe stand-in, apoi etapele separat.
+    Stand-in-ul nu pastreaza cartile primite, ca peak RSS sa fie al loader-ului.
+    """
+    client = LocalRecombee(latency_ms=args.latency_ms, per_request_ms=args.per_request_ms, seed=0,
+                           store_items=False)
+    cpu0 = time.process_time()
+    wall = run_loader(client, "--chunksize", str(args.chunksize), "--workers", str(args.workers), csv=args.csv)
+    cpu_total = time.process_time() - cpu0
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB -> MB (Linux)
+
+    rows, cpu = _stage_cpu(args.csv, args.chunksize, load_books.BATCH_SIZE)
+    # restul CPU-ului din rularea completa: dispatch, stand-in, thread-uri
+    cpu["send"] = max(0.0, cpu_total - sum(cpu.values()))
+    cpu["total"] = cpu_total
+
+    latencies = np.array(client.latencies) * 1000
+    result = {
+        "rows": rows,
+        "wall_s": wall,
+        "rows_per_s": rows / wall,
+        "sub_requests": client.requests,
+        "sub_requests_per_s": client.requests / wall,
+        "batches": client.batches,
+        "batch_latency_ms": {
+            "p50": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "p99": float(np.percentile(latencies, 99)) if len(latencies) else None,
+        },
+        "peak_rss_mb": peak_rss,
+        "cpu_s": cpu,
+    }
+    with open(args.json_out, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+
+def _git_rev() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _print_ingest(scale: int, r: dict, baseline: dict | None):
+    cpu = r["cpu_s"]
+    line = (
+        f"x{scale:<3d} rows={r['rows']:9d}  {r['rows_per_s']:9.0f} rows/s  {r['sub_requests_per_s']:9.0f} req/s  "
+        f"p50={r['batch_latency_ms']['p50']:7.1f} ms  p99={r['batch_latency_ms']['p99']:7.1f} ms  "
+        f"rss={r['peak_rss_mb']:7.0f} MB  cpu parse/transform/serialize/send="
+        f"{cpu['parse']:.1f}/{cpu['transform']:.1f}/{cpu['serialize']:.1f}/{cpu['send']:.1f} s"
+    )
+    if baseline is not None:
+        line += f"  ({(r['rows_per_s'] / baseline['rows_per_s'] - 1) * 100:+.1f}% rows/s fata de baseline)"
+    print(line)
+
+
+def bench_ingest(args):
+    scales = [int(x) for x in args.scales.split(",") if x.strip()]
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = {r["scale"]: r for r in json.load(f)["results"]}
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            csv = args.csv
+            if scale > 1:
+                csv = os.path.join(tmp, f"books_x{scale}.csv")
+                write_scaled_csv(args.csv, csv, scale)
+
+            out = os.path.join(tmp, f"result_x{scale}.json")
+            cmd = [sys.executable, os.path.abspath(__file__), "--csv", csv, "ingest-one", "--json-out", out,
+                   "--latency-ms", str(args.latency_ms), "--per-request-ms", str(args.per_request_ms),
+                   "--workers", str(args.workers), "--chunksize", str(args.chunksize)]
+            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+            with open(out, encoding="utf-8") as f:
+                result = {"scale": scale, **json.load(f)}
+            results.append(result)
+            _print_ingest(scale, result, baseline.get(scale))
+
+            if scale > 1:
+                os.remove(csv)
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "git_rev": _git_rev(),
+        "config": {
+            "csv": os.path.abspath(args.csv),
+            "latency_ms": args.latency_ms,
+            "per_request_ms": args.per_request_ms,
+            "workers": args.workers,
+            "chunksize": args.chunksize,
+            "batch_size": load_books.BATCH_SIZE,
+        },
+        "results": results,
+    }
+    out_path = args.out or os.path.join("bench_results", f"ingest-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Rezultate scrise in {out_path}")
+
+
+# ---------- search: index local vs SearchItems ----------
+
+def search_queries(df: pd.DataFrame, n: int, seed: int = 0) -> list:
+    """
+    (tip, query, bookId) pentru n carti alese dintre cele mai populare 5000:
+    full = primele 4 cuvinte din titlu, prefix = titlul taiat in mijlocul
+    unui cuvant (autocomplete), typo = o litera lipsa dintr-un cuvant lung.
+    """
+    rng = np.random.default_rng(seed)
+    popular = df.drop_duplicates("bookId").nlargest(5000, "numRatings")
+    sample = popular.iloc[rng.choice(len(popular), size=min(n, len(popular)), replace=False)]
+    queries = []
+    for book_id, title in zip(sample["bookId"], sample["title"].astype(str)):
+        words = title.split()[:4]
+        queries.append(("full", " ".join(words), book_id))
+        text = " ".join(words)
+        queries.append(("prefix", text[:max(3, int(len(text) * 0.6))], book_id))
+        long_words = [i for i, w in enumerate(words) if len(w) >= 5]
+        if long_words:
+            i = long_words[rng.integers(len(long_words))]
+            j = int(rng.integers(1, len(words[i]) - 1))
+            typo = words[:i] + [words[i][:j] + words[i][j + 1:]] + words[i + 1:]
+            queries.append(("typo", " ".join(typo), book_id))
+    return queries
+
+
+def bench_search(args):
+    df = catalog.load_catalog(args.csv)
+    t0 = time.perf_counter()
+    index = search_index.SearchIndex.from_frame(df)
+    print(f"Index: {len(index)} carti, {len(index.terms)} termeni, construit in {time.perf_counter() - t0:.2f} s")
+
+    client = LocalRecombee(latency_ms=args.rtt_ms, seed=0).load_catalog(args.csv)
+    client.send(SearchItems("bench", "x", 1, cascade_create=True))
+    # aceeasi carte in alta editie (alt bookId) conteaza ca gasita
+    titles = dict(zip(index.item_ids, (search_index.fold(t) for t in index.frame["title"])))
+
+    def remote(query, count):
+        return client.send(SearchItems("bench", query, count, return_properties=True))
+
+    queries = search_queries(df, args.queries)
+    # "ids" = doar cautarea in index; restul = search(), exact ce apeleaza app / streamlit_app
+    modes = ["ids", "local", "remote", "fallback", "merge"]
+    print(f"{len(queries)} query-uri, SearchItems pe stand-in cu {args.rtt_ms:g} ms RTT\n")
+    print(f"{'mod':10} {'p50 ms':>8} {'p99 ms':>8}   recall@5 " + "  ".join(f"{k:>6}" for k in ("full", "prefix", "typo")))
+    for mode in modes:
+        latencies = []
+        hits = {}
+        for kind, query, book_id in queries:
+            t = time.perf_counter()
+            if mode == "ids":
+                ids = [i for i, _ in index.search(query, 5)]  # fara materializarea valorilor
+            else:
+                resp = search_index.search(index, query, 5, mode=mode, remote=remote)
+                ids = [r["id"] for r in resp["recomms"]]
+            latencies.append((time.perf_counter() - t) * 1000)
+            found = book_id in ids or any(titles.get(i) == titles[book_id] for i in ids)
+            hits.setdefault(kind, []).append(found)
+
+        lat = np.array(latencies)
+        total = np.mean([h for v in hits.values() for h in v])
+        by_kind = "  ".join(f"{np.mean(hits.get(k, [0])):6.2f}" for k in ("full", "prefix", "typo"))
+        print(f"{mode:10} {np.percentile(lat, 50):8.2f} {np.percentile(lat, 99):8.2f}   {total:8.2f} {by_kind}")
+
+
+# ---------- ann: IVF vs cautare exacta ----------
+
+def bench_ann(args):
+    t0 = time.perf_counter()
+    base = ann_index.AnnIndex.from_catalog(args.csv, lists=args.lists)
+    vectors = np.asarray(base.vectors)
+    print(f"Vectori: {vectors.shape[0]} x {vectors.shape[1]}, index cu {args.lists} grupuri "
+          f"in {time.perf_counter() - t0:.2f} s")
+
+    rng = np.random.default_rng(0)
+    nonzero = np.flatnonzero(vectors.any(axis=1))
+    queries = rng.choice(nonzero, size=min(args.queries, len(nonzero)), replace=False)
+
+    t = time.perf_counter()
+    truth = [set(ann_index.exact_query(vectors, vectors[q], 10, exclude=q)[0].tolist()) for q in queries]
+    exact_qps = len(queries) / (time.perf_counter() - t)
+    print(f"{len(queries)} query-uri (carti cu descriere)\n")
+    print(f"{'metoda':14} {'recall@10':>9} {'QPS':>9} {'candidati':>10}")
+    print(f"{'exact':14} {1.0:9.3f} {exact_qps:9.0f} {len(vectors):10}")
+    for probes in (int(p) for p in args.probes.split(",")):
+        t = time.perf_counter()
+        found = [base.ivf.query(vectors[q], 10, exclude=q, probes=probes)[0] for q in queries]
+        qps = len(queries) / (time.perf_counter() - t)
+        recall = np.mean([len(gt & set(ids.tolist())) / 10 for gt, ids in zip(truth, found)])
+        candidates = np.mean([len(base.ivf.candidates(vectors[q], probes)) for q in queries[:100]])
+        print(f"{f'ivf probes={probes}':14} {recall:9.3f} {qps:9.0f} {candidates:10.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default=catalog.CSV_PATH)
+    parser.add_argument("--scale", type=int, default=1, help="multiplica randurile CSV-ului")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("transform").set_defaults(func=bench_transform)
+    sub.add_parser("dates").set_defaults(func=bench_dates)
+    p = sub.add_parser("requests")
+    p.add_argument("--rtt-ms", type=float, default=40.0, help="latenta fixa per batch")
+    p.add_argument("--per-request-ms", type=float, default=0.2, help="cost per sub-cerere")
+    p.set_defaults(func=bench_requests)
+
+    p = sub.add_parser("search")
+    p.add_argument("--queries", type=int, default=300, help="cate carti esantionam")
+    p.add_argument("--rtt-ms", type=float, default=0.0, help="latenta adaugata la SearchItems (stand-in)")
+    p.set_defaults(func=bench_search)
+
+    p = sub.add_parser("ann")
+    p.add_argument("--queries", type=int, default=500, help="cate carti folosim ca query")
+    p.add_argument("--lists", type=int, default=ann_index.DEFAULT_LISTS, help="grupuri IVF")
+    p.add_argument("--probes", default="4,8,16,32", help="valorile ANN_PROBES comparate, separate prin virgula")
+    p.set_defaults(func=bench_ann)
+
+    p = sub.add_parser("ingest")
+    p.add_argument("--scales", default="1,10,50", help="multiplicatorii CSV-ului, separati prin virgula")
+    p.add_argument("--latency-ms", type=float, default=20.0, help="latenta stand-in-ului per batch")
+    p.add_argument("--per-request-ms", type=float, default=0.05, help="cost stand-in per sub-cerere")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--chunksize", type=int, default=50000)
+    p.add_argument("--out", default=None, help="fisierul JSON (implicit bench_results/ingest-<data>.json)")
+    p.add_argument("--baseline", default=None, help="un JSON anterior, pentru comparatie")
+    p.set_defaults(func=bench_ingest)
+
+    p = sub.add_parser("ingest-one", help=argparse.SUPPRESS)
+    p.add_argument("--json-out", required=True)
+    p.add_argument("--latency-ms", type=float, default=20.0)
+    p.add_argument("--per-request-ms", type=float, default=0.05)
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--chunksize", type=int, default=50000)
+    p.set_defaults(func=bench_ingest_one)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,592 @@
+"""
+Catalogul de carti din CSV: citire, coloane derivate / curatate si un cache
+columnar pe disc (Feather), ca sa nu re-parsam CSV-ul la fiecare pornire.
+
+    df = load_catalog()   # din cache daca CSV-ul nu s-a schimbat
+"""
+import ast
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+
+try:
+    import fcntl  # lock intre procese; pe Windows ramane doar cel intre thread-uri
+except ImportError:
+    fcntl = None
+
+
+CSV_PATH = "books_1.Best_Books_Ever.csv"
+CACHE_DIR = ".catalog_cache"
+
+# se incrementeaza cand se schimba prepare(), ca sa invalidam cache-urile vechi
+CACHE_VERSION = 4
+
+# doar coloanele pe care le folosim efectiv
+# (fara setting, coverImg etc.)
+USECOLS = [
+    "bookId", "title", "series", "author", "rating", "description",
+    "language", "genres", "characters", "bookFormat", "pages", "publisher",
+    "publishDate", "firstPublishDate", "awards", "numRatings", "ratingsByStars",
+    "likedPercent", "bbeScore", "bbeVotes", "price",
+]
+
+# ratingsByStars: "['3444695', '1921313', '745221', '171994', '93557']", de la 5 stele la 1
+STAR_COLUMNS = ["stars_5", "stars_4", "stars_3", "stars_2", "stars_1"]
+_STARS_RE = r"^\[\s*" + r",\s*".join([r"'(\d+)'"] * 5) + r"\s*\]$"
+
+# datele raman text chiar daca o bucata contine doar ani ("1995")
+DTYPES = {"firstPublishDate": str, "publishDate": str}
+
+# coloane stocate in CSV ca literal de lista Python: "['Fiction', 'Fantasy']"
+LIST_COLUMNS = ["genres", "characters", "awards"]
+
+# "(Illustrator)", "(Goodreads Author)" din coloana author
+ROLE_RE = re.compile(r"\([^)]*\)")
+
+
+# ---------- setari din mediu ----------
+
+def env_str(name: str, default: str) -> str:
+    """Variabila de mediu (fara spatii); `default` doar daca lipseste ('' ramane '')."""
+    value = os.environ.get(name)
+    return default if value is None else value.strip()
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name, "").strip()
+    return int(value) if value else default
+
+
+def env_float(name: str, default: float = 0.0) -> float:
+    value = os.environ.get(name, "").strip()
+    return float(value) if value else default
+
+
+# ---------- coloane de tip lista ----------
+
+# un element '...' sau "..." dintr-un repr() de lista, cu escape-uri
+# (forma "unrolled", mult mai rapida decat (?:[^'\\]|\\.)*)
+_ITEM_RE = re.compile(r"'([^'\\]*(?:\\.[^'\\]*)*)'" + r'|"([^"\\]*(?:\\.[^"\\]*)*)"')
+
+
+def _unquote(single: str, double: str) -> str:
+    # escape-urile (\' , \xa0 ...) sunt rare; doar atunci apelam literal_eval
+    if "\\" in single:
+        return ast.literal_eval("'" + single + "'")
+    if "\\" in double:
+        return ast.literal_eval('"' + double + '"')
+    return single or double
+
+
+class ListColumn:
+    """
+    O coloana de liste de string-uri in forma CSR:
+    - vocab:   valorile distincte (internate), id = pozitia in vocab;
+    - indptr:  int64, len = randuri + 1; randul i are indices[indptr[i]:indptr[i+1]];
+    - indices: int32, id-urile din vocab, in ordinea din CSV.
+    Filtrarea / profilurile / similaritatea pot lucra direct pe array-urile
+    de intregi; row() si to_lists() reconstruiesc listele de string-uri.
+    """
+
+    def __init__(self, vocab: list, indptr: np.ndarray, indices: np.ndarray):
+        self.vocab = vocab
+        self.indptr = indptr
+        self.indices = indices
+        self._ids = None
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def term_id(self, term: str) -> int | None:
+        if self._ids is None:
+            self._ids = {t: i for i, t in enumerate(self.vocab)}
+        return self._ids.get(term)
+
+    def row_ids(self, i: int) -> np.ndarray:
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def row(self, i: int) -> list:
+        return [self.vocab[j] for j in self.row_ids(i)]
+
+    def lengths(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def row_of_each_value(self) -> np.ndarray:
+        """Pentru fiecare pozitie din indices, randul caruia ii apartine."""
+        return np.repeat(np.arange(len(self), dtype=np.int64), self.lengths())
+
+    def mask(self, term: str) -> np.ndarray:
+        """Masca bool a randurilor care contin `term`."""
+        out = np.zeros(len(self), dtype=bool)
+        tid = self.term_id(term)
+        if tid is not None:
+            out[self.row_of_each_value()[self.indices == tid]] = True
+        return out
+
+    def doc_freq(self) -> np.ndarray:
+        """In cate randuri apare fiecare id din vocab."""
+        return np.bincount(self.indices, minlength=len(self.vocab))
+
+    def take(self, rows: np.ndarray) -> "ListColumn":
+        """Doar randurile `rows` (in ordinea data), cu acelasi vocab."""
+        rows = np.asarray(rows, dtype=np.int64)
+        lengths = self.indptr[rows + 1] - self.indptr[rows]
+        indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        starts = np.repeat(self.indptr[rows] - indptr[:-1], lengths)
+        indices = self.indices[starts + np.arange(indptr[-1])]
+        return ListColumn(self.vocab, indptr, indices)
+
+    def to_lists(self) -> list:
+        vocab = self.vocab
+        values = [vocab[j] for j in self.indices.tolist()]
+        bounds = self.indptr.tolist()
+        return [values[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def save(self, prefix: str):
+        save_array(prefix + ".indptr.npy", self.indptr)
+        save_array(prefix + ".indices.npy", self.indices)
+        save_json(prefix + ".vocab.json", self.vocab)
+
+    @classmethod
+    def load(cls, prefix: str, mmap: bool = True) -> "ListColumn":
+        mode = "r" if mmap else None
+        with open(prefix + ".vocab.json", encoding="utf-8") as f:
+            vocab = json.load(f)
+        return cls(
+            vocab,
+            np.load(prefix + ".indptr.npy", mmap_mode=mode),
+            np.load(prefix + ".indices.npy", mmap_mode=mode),
+        )
+
+
+def parse_list_column(s: pd.Series) -> ListColumn:
+    """
+    "['A', 'B']" -> ListColumn, pe toata coloana (fara ast.literal_eval per rand).
+    NaN / string gol -> lista goala.
+    """
+    s = s.fillna("").astype(str)
+    found = s.str.findall(_ITEM_RE).tolist()
+    lengths = np.fromiter((len(f) for f in found), dtype=np.int64, count=len(found))
+    if s.str.contains("\\", regex=False).any():
+        flat = [_unquote(a, b) for row in found for a, b in row]
+    else:
+        flat = [a or b for row in found for a, b in row]
+
+    codes, uniques = pd.factorize(np.array(flat, dtype=object))
+    indptr = np.zeros(len(found) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    vocab = [sys.intern(str(v)) for v in uniques]
+    return ListColumn(vocab, indptr, codes.astype(np.int32))
+
+
+# ---------- anul publicarii ----------
+
+_MONTHS = {
+    m: i for i, m in enumerate(
+        ["january", "february", "march", "april", "may", "june", "july",
+         "august", "september", "october", "november", "december"], start=1)
+}
+_MONTH_RE = "(" + "|".join(_MONTHS) + ")"
+
+# formatele care acopera aproape tot CSV-ul
+_DATE_MDY2 = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{2})")  # 11/06/99
+_DATE_YEAR = re.compile(r"(\d{4})")  # 1995
+_DATE_MONTH_DAY_YEAR = re.compile(_MONTH_RE + r" (\d{1,2})(?:st|nd|rd|th) (\d{4})", re.IGNORECASE)  # May 20th 2008
+_DATE_MONTH_YEAR = re.compile(_MONTH_RE + r" (\d{4})", re.IGNORECASE)  # April 2012
+
+# memo raw string -> an, comun pentru toate bucatile / coloanele
+_YEAR_CACHE = {}
+
+
+def _two_digit_year(yy: int) -> int:
+    # regula lui dateutil (folosita de pd.to_datetime): secolul care pune anul
+    # la cel mult 50 de ani de anul curent, deci "01/01/56" -> 2056
+    this_year = date.today().year
+    year = this_year // 100 * 100 + yy
+    if year >= this_year + 50:
+        year -= 100
+    elif year < this_year - 50:
+        year += 100
+    return year
+
+
+def _valid(year: int, month: int, day: int) -> bool:
+    try:
+        date(year, month, day)
+        return True
+    except ValueError:
+        return False
+
+
+def _year_of(raw: str) -> float:
+    raw = raw.strip()
+    m = _DATE_MDY2.fullmatch(raw)
+    if m:
+        year = _two_digit_year(int(m[3]))
+        return float(year) if _valid(year, int(m[1]), int(m[2])) else np.nan
+    m = _DATE_YEAR.fullmatch(raw)
+    if m:
+        year = int(m[1])
+        return float(year) if year >= 1 else np.nan
+    m = _DATE_MONTH_DAY_YEAR.fullmatch(raw)
+    if m:
+        year = int(m[3])
+        return float(year) if _valid(year, _MONTHS[m[1].lower()], int(m[2])) else np.nan
+    m = _DATE_MONTH_YEAR.fullmatch(raw)
+    if m:
+        year = int(m[2])
+        return float(year) if year >= 1 else np.nan
+
+    # restul (texte libere, "Published", "Expected publication: ...") – rar
+    parsed = pd.to_datetime(raw, errors="coerce")
+    return np.nan if pd.isna(parsed) else float(parsed.year)
+
+
+def parse_year(s: pd.Series) -> pd.Series:
+    """
+    Anul dintr-o coloana de date in format liber, acelasi rezultat ca
+    pd.to_datetime(s, errors="coerce").dt.year, dar: fiecare string distinct
+    e evaluat o singura data (memo), formatele uzuale merg pe regex-uri
+    precompilate si doar restul ajunge la pd.to_datetime.
+    """
+    codes, uniques = pd.factorize(s)
+    years = np.empty(len(uniques) + 1, dtype="float64")
+    years[-1] = np.nan  # codes == -1 -> NaN
+    for i, raw in enumerate(uniques):
+        year = _YEAR_CACHE.get(raw)
+        if year is None:
+            year = _YEAR_CACHE[raw] = _year_of(str(raw))
+        years[i] = year
+    return pd.Series(years[codes], index=s.index)
+
+
+def add_derived_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Adauga publish_year, description_len si popularity pe frame."""
+    # derivam anul publicarii din firstPublishDate / publishDate
+    nan = pd.Series(np.nan, index=df.index)
+    first = parse_year(df["firstPublishDate"]) if "firstPublishDate" in df.columns else nan
+    published = parse_year(df["publishDate"]) if "publishDate" in df.columns else nan
+    df["publish_year"] = first.fillna(published)
+
+    # lungimea descrierii
+    df["description_len"] = df["description"].fillna("").astype(str).str.len()
+
+    # popularitate simpla = numRatings
+    df["popularity"] = df["numRatings"].fillna(0)
+
+    # distributia rating-urilor (lipsa / "[]" -> NA), pentru popularity.py
+    if "ratingsByStars" in df.columns:
+        stars = df["ratingsByStars"].astype("string").str.extract(_STARS_RE)
+        for i, col in enumerate(STAR_COLUMNS):
+            df[col] = stars[i]
+    return df
+
+
+def _to_int(s: pd.Series) -> pd.Series:
+    # ca safe_int: invalid -> NA, zecimalele se taie
+    return np.trunc(pd.to_numeric(s, errors="coerce").astype("float64")).astype("Int64")
+
+
+def clean_columns(df: pd.DataFrame, lists: dict | None = None) -> pd.DataFrame:
+    """
+    Tipuri finale pentru coloanele de dupa add_derived_columns():
+    numerice coerced, genres ca lista, has_awards ca bool. Coloanele brute
+    de data / premii / personaje nu mai sunt necesare si sunt scoase.
+    `lists` poate contine coloanele LIST_COLUMNS deja parsate.
+    """
+    if lists is None:
+        lists = {c: parse_list_column(df[c]) for c in ("genres", "awards")}
+
+    for col in ["pages", "numRatings", "bbeVotes", "publish_year", "description_len", *STAR_COLUMNS]:
+        if col in df.columns:
+            df[col] = _to_int(df[col])
+    for col in ["rating", "likedPercent", "bbeScore", "price", "popularity"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+
+    # genuri ca set (lista)
+    df["genres"] = lists["genres"].to_lists()
+
+    # premii – flag simplu ("[]" inseamna fara premii)
+    df["has_awards"] = lists["awards"].lengths() > 0
+
+    return df.drop(columns=["firstPublishDate", "publishDate", "awards", "characters", "ratingsByStars"],
+                   errors="ignore")
+
+
+def prepare(df: pd.DataFrame, lists: dict | None = None) -> pd.DataFrame:
+    """Frame brut din CSV -> frame curat, tipizat, cu coloanele derivate."""
+    return clean_columns(add_derived_columns(df), lists)
+
+
+def _is_used_column(col: str) -> bool:
+    # callable in loc de lista, ca sa nu crape daca lipseste o coloana
+    return col in USECOLS
+
+
+def _no_stage(name: str):
+    return nullcontext()
+
+
+def iter_frames(path: str = CSV_PATH, chunksize: int | None = None, metrics=None, keep=None):
+    """
+    Citeste CSV-ul (doar USECOLS) si genereaza frame-uri pregatite.
+    Cu `chunksize` citim cate N randuri o data, deci memoria nu depinde
+    de marimea fisierului; fara el intoarcem un singur frame.
+    keep(df) -> masca booleana, daca e dat, filtreaza randurile brute inainte
+    de derive_columns / clean_columns (ex. shard-ul unui proces: fiecare
+    proces pregateste doar randurile lui).
+    Cu `metrics` (metrics.Metrics) masuram separat read_csv,
+    derive_columns (aici se parseaza datele) si clean_columns.
+    """
+    stage = metrics.stage if metrics is not None else _no_stage
+    with stage("read_csv"):
+        if chunksize:
+            reader = pd.read_csv(path, usecols=_is_used_column, dtype=DTYPES, chunksize=chunksize)
+        else:
+            reader = iter([pd.read_csv(path, usecols=_is_used_column, dtype=DTYPES)])
+
+    while True:
+        with stage("read_csv"):
+            df = next(reader, None)
+        if df is None:
+            return
+        if keep is not None:
+            with stage("shard_filter"):
+                df = df[keep(df)]
+        # ca prepare(), dar cu etapele masurate separat
+        with stage("derive_columns"):  # publish_year (parsarea datelor) & co.
+            df = add_derived_columns(df)
+        with stage("clean_columns"):  # numerice + listele genres/awards
+            df = clean_columns(df)
+        yield df
+
+
+# ---------- cache pe disc ----------
+
+def file_hash(path: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def tmp_path(path: str) -> str:
+    """Fisier temporar unic per proces si thread, pentru scrieri atomice (tmp + os.replace)."""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def save_array(path: str, arr: np.ndarray):
+    """
+    np.save atomic: alte procese pot avea fisierul vechi deschis cu
+    mmap_mode="r", iar os.replace le lasa inode-ul vechi intact.
+    """
+    tmp = tmp_path(path)
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+def save_json(path: str, obj):
+    tmp = tmp_path(path)
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+_build_lock = threading.Lock()
+
+
+@contextmanager
+def _cache_lock(cache_dir: str):
+    """
+    Un singur builder per cache: la pornirea la rece toate indexurile din
+    fundal cer catalogul deodata; ceilalti asteapta si citesc cache-ul scris.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    with _build_lock, open(os.path.join(cache_dir, "build.lock"), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)  # eliberat la inchiderea fisierului
+        yield
+
+
+def _cache_paths(cache_dir: str) -> tuple[str, str]:
+    return os.path.join(cache_dir, "catalog.feather"), os.path.join(cache_dir, "meta.json")
+
+
+def _list_prefix(cache_dir: str, name: str) -> str:
+    return os.path.join(cache_dir, name)
+
+
+def _read_meta(meta_path: str) -> dict:
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_meta(meta_path: str, meta: dict):
+    save_json(meta_path, meta)
+
+
+def cache_is_valid(path: str = CSV_PATH, cache_dir: str = CACHE_DIR) -> bool:
+    """
+    Cache-ul e valid daca e pentru acelasi CSV, aceeasi versiune si acelasi
+    continut. Daca marimea + mtime coincid nu mai calculam hash-ul; daca doar
+    mtime difera (ex. `touch`), verificam hash-ul si actualizam meta.
+    """
+    data_path, meta_path = _cache_paths(cache_dir)
+    meta = _read_meta(meta_path)
+    if not os.path.exists(data_path) or meta.get("version") != CACHE_VERSION:
+        return False
+    if meta.get("csv") != os.path.abspath(path):
+        return False
+
+    st = os.stat(path)
+    if meta.get("size") == st.st_size and meta.get("mtime_ns") == st.st_mtime_ns:
+        return True
+    if meta.get("size") != st.st_size or meta.get("sha") != file_hash(path):
+        return False
+
+    meta["mtime_ns"] = st.st_mtime_ns
+    _write_meta(meta_path, meta)
+    return True
+
+
+def cache_meta(path: str = CSV_PATH, cache_dir: str = CACHE_DIR) -> dict:
+    """Meta-ul cache-ului (version, sha al CSV-ului, rows...), reconstruit daca e nevoie."""
+    ensure_cache(path, cache_dir)
+    return _read_meta(_cache_paths(cache_dir)[1])
+
+
+def ensure_cache(path: str = CSV_PATH, cache_dir: str = CACHE_DIR) -> pd.DataFrame | None:
+    """
+    Reconstruieste cache-ul daca nu e valid; intoarce frame-ul construit sau
+    None daca cache-ul era deja bun (sau l-a scris intre timp alt builder).
+    """
+    if cache_is_valid(path, cache_dir):
+        return None
+    with _cache_lock(cache_dir):
+        if cache_is_valid(path, cache_dir):
+            return None
+        return _build_cache(path, cache_dir)
+
+
+def build_cache(path: str = CSV_PATH, cache_dir: str = CACHE_DIR) -> pd.DataFrame:
+    """
+    Parseaza CSV-ul o data si scrie in cache frame-ul pregatit (Feather)
+    plus coloanele LIST_COLUMNS in forma CSR (.npy + vocab).
+    """
+    with _cache_lock(cache_dir):
+        return _build_cache(path, cache_dir)
+
+
+def _build_cache(path: str, cache_dir: str) -> pd.DataFrame:
+    st = os.stat(path)
+    sha = file_hash(path)
+    raw = pd.read_csv(path, usecols=_is_used_column, dtype=DTYPES)
+    lists = {c: parse_list_column(raw[c]) for c in LIST_COLUMNS if c in raw.columns}
+    df = prepare(raw, lists).reset_index(drop=True)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    data_path, meta_path = _cache_paths(cache_dir)
+    for name, col in lists.items():
+        col.save(_list_prefix(cache_dir, name))
+    tmp = tmp_path(data_path)
+    # genres sta doar in CSR; necomprimat -> se poate mmap
+    feather.write_feather(df.drop(columns=["genres"]), tmp, compression="uncompressed")
+    os.replace(tmp, data_path)
+    _write_meta(meta_path, {
+        "version": CACHE_VERSION,
+        "csv": os.path.abspath(path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "sha": sha,
+        "rows": len(df),
+    })
+    return df
+
+
+def load_catalog(path: str = CSV_PATH, cache_dir: str = CACHE_DIR, use_cache: bool = True) -> pd.DataFrame:
+    """
+    Frame-ul pregatit al catalogului. Cu cache valid il citim memory-mapped
+    din Feather; altfel parsam CSV-ul si reconstruim cache-ul.
+    """
+    if not use_cache:
+        return next(iter_frames(path))
+    built = ensure_cache(path, cache_dir)
+    if built is not None:
+        return built
+
+    data_path, _ = _cache_paths(cache_dir)
+    df = feather.read_table(data_path, memory_map=True).to_pandas()
+    df["genres"] = ListColumn.load(_list_prefix(cache_dir, "genres")).to_lists()
+    return df
+
+
+def load_lists(path: str = CSV_PATH, cache_dir: str = CACHE_DIR) -> dict:
+    """
+    {coloana: ListColumn} pentru LIST_COLUMNS, memory-mapped din cache
+    (reconstruit daca e nevoie). Randul i corespunde randului i din
+    load_catalog().
+    """
+    ensure_cache(path, cache_dir)
+    return {c: ListColumn.load(_list_prefix(cache_dir, c)) for c in LIST_COLUMNS}
+
+
+# ---------- proprietatile Recombee, din catalog ----------
+
+_props = {}  # (csv, cache_dir) -> load_books.PropsTable
+_props_lock = threading.Lock()
+
+
+def shared_props(path: str = CSV_PATH, cache_dir: str = CACHE_DIR):
+    """
+    Proprietatile tuturor cartilor, convertite o data per proces si CSV
+    (~1 s), comune pentru toate sursele locale: cautare, similare, ANN,
+    clasament. Builder-ii lor o apeleaza in fundal, ca primul raspuns sa
+    nu plateasca conversia.
+    """
+    key = (os.path.abspath(path), os.path.abspath(cache_dir))
+    with _props_lock:
+        table = _props.get(key)
+        if table is None:
+            import load_books
+
+            table = _props[key] = load_books.PropsTable(load_catalog(path, cache_dir))
+    return table
+
+
+def props_for(item_ids: list, path: str | None = None, cache_dir: str = CACHE_DIR) -> dict:
+    """{item_id: proprietatile complete, ca in Recombee} pentru cartile cunoscute."""
+    if not item_ids:
+        return {}
+    return shared_props(path or CSV_PATH, cache_dir).get(item_ids)
+
+
+def as_recomms(item_ids: list, path: str | None = None) -> dict:
+    """
+    Raspuns in forma SearchItems / RecommendItems* ({"recomms": [{"id", "values"}]}), din catalog.
+    `path` e csv_path-ul sursei locale (indexul, tabela, clasamentul); None = CSV_PATH.
+    """
+    values = props_for(item_ids, path)
+    return {"recomms": [{"id": item_id, "values": values.get(item_id, {})} for item_id in item_ids]}
+
+
+if __name__ == "__main__":
+    import time
+
+    t0 = time.perf_counter()
+    frame = build_cache()
+    print(f"Cache scris in {CACHE_DIR}: {len(frame)} randuri, {time.perf_counter() - t0:.2f} s")
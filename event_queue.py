@@ -0,0 +1,296 @@
+"""
+Coada write-behind pentru interactiuni (AddDetailView, AddRating).
+
+Pentru utilizator, vizitele si rating-urile sunt "fire and forget": nu are
+rost sa astepte round trip-ul catre Recombee. add_detail_view() / add_rating()
+doar pun evenimentul in coada si se intorc imediat; un thread de fundal le
+trimite in Batch cand se strang `max_batch` evenimente sau cel tarziu la
+`flush_interval` secunde.
+
+- fiecare eveniment are timestamp-ul momentului in care a avut loc, deci
+  trimiterea intarziata nu schimba ordinea / momentul interactiunii;
+- erorile tranzitorii (timeout, 5xx, 429, conexiune) se reincearca; ce nu
+  trece ramane in coada pentru urmatorul flush;
+- sub-cererile respinse definitiv (4xx) sunt numarate in `dropped`;
+- evenimentele neconfirmate sunt tinute si pe disc (JSON lines), intr-un
+  fisier per coada: `interactions.spill.<pid>-<n>.jsonl`. La pornire, coada
+  preia (sub lock) fisierele proceselor care nu mai ruleaza, deci dupa un
+  crash evenimentele sunt reluate o singura data, chiar daca app.py si
+  streamlit_app.py ruleaza in acelasi director.
+
+    EVENT_QUEUE_SPILL=interactions.spill.jsonl   ('' = fara fisier)
+    EVENT_QUEUE_MAX_BATCH=100
+    EVENT_QUEUE_FLUSH_S=2
+"""
+import atexit
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: fara lock intre procese
+    fcntl = None
+
+from recombee_api_client.api_requests import AddDetailView, AddRating, Batch
+
+from catalog import env_str
+from recombee_client import is_transient
+
+SPILL_PATH = "interactions.spill.jsonl"
+
+_shared = None  # (pid, coada)
+_shared_lock = threading.Lock()
+_spill_ids = itertools.count()
+
+
+@contextmanager
+def _locked(path: str):
+    with open(path, "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)  # eliberat la inchiderea fisierului
+        yield
+
+
+def _is_live(spill_path: str) -> bool:
+    """Fisierul e al unei cozi care inca ruleaza (ii tine lock-ul `.lock`)?"""
+    if fcntl is None or not os.path.exists(spill_path + ".lock"):
+        return False
+    with open(spill_path + ".lock", "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return True
+    return False
+
+
+def event_to_request(event: dict):
+    if event["type"] == "AddDetailView":
+        return AddDetailView(event["user_id"], event["item_id"], timestamp=event["timestamp"], cascade_create=True)
+    if event["type"] == "AddRating":
+        return AddRating(event["user_id"], event["item_id"], event["rating"],
+                         timestamp=event["timestamp"], cascade_create=True)
+    raise ValueError(f"tip de eveniment necunoscut: {event['type']}")
+
+
+class WriteBehindQueue:
+    def __init__(self, client, spill_path: str | None = SPILL_PATH, max_batch: int = 100,
+                 flush_interval: float = 2.0, tries: int = 3, base_sleep: float = 0.5):
+        self.client = client
+        self.spill_base = spill_path or None
+        self.spill_path = None  # fisierul acestei cozi, vezi _adopt_spills()
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.tries = tries
+        self.base_sleep = base_sleep
+
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closing = False
+        self._owner = None  # lock-ul care arata ca fisierul nostru de spill e in uz
+        self._spill = None
+        self._pending = self._adopt_spills()  # evenimente neconfirmate, in ordinea sosirii
+        if self.spill_path and self._spill is None:
+            self._spill = open(self.spill_path, "a", encoding="utf-8")
+        self.sent = 0
+        self.dropped = 0
+        self.last_error = None
+
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    # ---------- producator ----------
+
+    def put(self, event: dict):
+        with self._cond:
+            if self._closing:
+                raise RuntimeError("coada e inchisa")
+            self._pending.append(event)
+            if self._spill is not None:
+                self._spill.write(json.dumps(event) + "\n")
+                self._spill.flush()
+            if len(self._pending) >= self.max_batch:
+                self._cond.notify()
+
+    def add_detail_view(self, user_id: str, item_id: str):
+        self.put({"type": "AddDetailView", "user_id": user_id, "item_id": item_id,
+                  "timestamp": time.time()})
+
+    def add_rating(self, user_id: str, item_id: str, rating: float):
+        self.put({"type": "AddRating", "user_id": user_id, "item_id": item_id, "rating": rating,
+                  "timestamp": time.time()})
+
+    def __len__(self):
+        with self._cond:
+            return len(self._pending)
+
+    # ---------- trimitere ----------
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._closing or len(self._pending) >= self.max_batch,
+                    timeout=self.flush_interval,
+                )
+                closing = self._closing
+            ok = self.flush()
+            with self._cond:
+                if closing and (not ok or not self._pending):
+                    self._release()
+                    return  # la inchidere: ce n-a trecut ramane in spill (preluat la pornirea urmatoare)
+                if not ok:
+                    self._cond.wait(self.flush_interval)  # Recombee nu raspunde: nu insistam in bucla
+
+    def _send(self, batch: list):
+        for i in range(self.tries):
+            try:
+                return self.client.send(Batch([event_to_request(e) for e in batch]))
+            except Exception as e:
+                if i == self.tries - 1 or not is_transient(e):
+                    raise
+                time.sleep(self.base_sleep * (2**i))
+
+    def flush(self) -> bool:
+        """Trimite urmatorul batch. False daca trimiterea a esuat (evenimentele raman in coada)."""
+        with self._flush_lock:
+            with self._cond:
+                batch = self._pending[:self.max_batch]
+            if not batch:
+                return True
+
+            try:
+                response = self._send(batch)
+            except Exception as e:
+                self.last_error = e
+                if not is_transient(e):
+                    # tot batch-ul e respins (ex. 400): nu-l mai retrimitem la nesfarsit
+                    self.dropped += len(batch)
+                    self._done(batch, [])
+                return False
+
+            retry = []
+            for event, result in zip(batch, response):
+                code = result.get("code", 200)
+                if 200 <= code < 300:
+                    self.sent += 1
+                elif code >= 500 or code == 429:
+                    retry.append(event)
+                else:
+                    self.dropped += 1
+                    self.last_error = result.get("json")
+            self._done(batch, retry)
+            return not retry
+
+    def _done(self, batch: list, retry: list):
+        # batch-ul e mereu prefixul cozii: doar flush() scoate, iar put() adauga la final
+        with self._cond:
+            self._pending = retry + self._pending[len(batch):]
+            self._rewrite_spill()
+
+    # ---------- spill ----------
+
+    def _adopt_spills(self) -> list:
+        """
+        Ia un fisier de spill propriu si preia evenimentele din fisierele
+        cozilor care nu mai ruleaza (si din vechiul fisier comun `spill_base`).
+        Sub lock, ca doua procese pornite deodata sa nu preia acelasi fisier.
+        """
+        if not self.spill_base:
+            return []
+        root, ext = os.path.splitext(self.spill_base)
+        self.spill_path = f"{root}.{os.getpid()}-{next(_spill_ids)}{ext}"
+        self._owner = open(self.spill_path + ".lock", "a")
+        if fcntl is not None:
+            fcntl.flock(self._owner, fcntl.LOCK_EX)
+
+        with _locked(root + ".lock"):
+            candidates = [self.spill_base] + sorted(glob.glob(glob.escape(root) + ".*" + glob.escape(ext)))
+            orphans = [p for p in candidates
+                       if p != self.spill_path and os.path.exists(p) and not _is_live(p)]
+            events = []
+            for path in orphans:
+                events.extend(_read_spill(path))
+            self._pending = events
+            if events:
+                self._rewrite_spill()  # intai le scriem la noi, apoi stergem originalele
+            for path in orphans:
+                os.remove(path)
+                if os.path.exists(path + ".lock"):
+                    os.remove(path + ".lock")
+        return events
+
+    def _release(self):
+        # dupa ultima rescriere a spill-ului: fisierul ramas poate fi preluat de alt proces
+        if self._owner is not None:
+            self._owner.close()
+            self._owner = None
+            if os.path.exists(self.spill_path + ".lock"):
+                os.remove(self.spill_path + ".lock")
+
+    def _rewrite_spill(self):
+        # si dupa close(): daca join-ul a expirat, thread-ul confirma batch-uri
+        # si dupa aceea, iar spill-ul trebuie sa le uite
+        if not self.spill_path:
+            return
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
+        if self._closing and not self._pending:
+            if os.path.exists(self.spill_path):
+                os.remove(self.spill_path)
+            return
+        tmp = self.spill_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(json.dumps(e) + "\n" for e in self._pending)
+        os.replace(tmp, self.spill_path)
+        if not self._closing:  # dupa close() put() nu mai scrie
+            self._spill = open(self.spill_path, "a", encoding="utf-8")
+
+    def close(self, timeout: float | None = 10.0):
+        """
+        Trimite ce a ramas (cat se poate in `timeout`) si opreste thread-ul.
+        Daca timeout-ul expira, thread-ul isi termina batch-ul curent si
+        actualizeaza spill-ul singur.
+        """
+        with self._cond:
+            if self._closing:
+                return
+            self._closing = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        with self._cond:
+            self._rewrite_spill()
+            if not self._thread.is_alive():
+                self._release()  # altfel o face thread-ul, dupa ultimul batch
+
+
+def _read_spill(path: str) -> list:
+    events = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                events.append(json.loads(line))
+            except ValueError:
+                pass  # ultima linie, scrisa pe jumatate la un crash
+    return events
+
+
+def shared_queue(client) -> WriteBehindQueue:
+    """Coada procesului (una singura: evenimentele trec printr-un singur thread de trimitere)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None or _shared[0] != os.getpid():
+            queue = WriteBehindQueue(
+                client,
+                spill_path=env_str("EVENT_QUEUE_SPILL", SPILL_PATH),
+                max_batch=int(env_str("EVENT_QUEUE_MAX_BATCH", "100") or 100),
+                flush_interval=float(env_str("EVENT_QUEUE_FLUSH_S", "2") or 2),
+            )
+            atexit.register(queue.close)
+            _shared = (os.getpid(), queue)
+        return _shared[1]
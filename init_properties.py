@@ -1,16 +1,12 @@
-import os
 from dotenv import load_dotenv
-from recombee_api_client.api_client import RecombeeClient, Region
 from recombee_api_client.api_requests import AddItemProperty, Batch
 
+from recombee_client import make_client
+
 
 load_dotenv()
 
-client = RecombeeClient(
-        os.environ["RECOMBEE_DB_ID"],
-        os.environ["RECOMBEE_API_TOKEN"],
-        region=Region[os.environ.get("RECOMBEE_REGION", "EU_WEST")],
-)
+client = make_client()
 
 
 def main():
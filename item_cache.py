@@ -0,0 +1,167 @@
+"""
+Cache comun (per proces) pentru proprietatile cartilor citite din Recombee.
+
+Catalogul se schimba doar la incarcarea de noapte, asa ca valorile unei
+carti vazute o data (GetItemValues sau `values` din SearchItems /
+RecommendItems* cu return_properties=True) pot fi refolosite fara retea.
+
+    ITEM_CACHE_TTL_S=21600          cat timp e valida o intrare (implicit 6 h)
+    ITEM_CACHE_MAX_BYTES=33554432   bugetul de memorie (implicit 32 MB)
+
+Evictia e LRU: cand bugetul e depasit scoatem intrarile cele mai vechi
+ca folosire. Marimea unei intrari e lungimea ei serializata JSON.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from recombee_api_client.api_requests import Batch, GetItemValues
+from recombee_api_client.exceptions import ResponseException
+
+from catalog import env_float
+
+DEFAULT_TTL_S = 6 * 3600
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+class ItemCache:
+    def __init__(self, ttl_s: float = DEFAULT_TTL_S, max_bytes: int = DEFAULT_MAX_BYTES, clock=time.monotonic):
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._entries = OrderedDict()  # item_id -> (values, bytes, expira_la)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, item_id: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(item_id)
+            if entry is None or entry[2] < self._clock():
+                if entry is not None:
+                    self._drop(item_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(item_id)
+            self.hits += 1
+            return dict(entry[0])  # copie: apelantii pot modifica rezultatul
+
+    def put(self, item_id: str, values: dict):
+        if not isinstance(values, dict):
+            return
+        size = len(json.dumps(values, default=str)) + len(item_id)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if item_id in self._entries:
+                self._drop(item_id)
+            self._entries[item_id] = (dict(values), size, self._clock() + self.ttl_s)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def put_recomms(self, response: dict):
+        """
+        Pastreaza `values` din raspunsul unui SearchItems / RecommendItems*.
+        Doar pentru cereri cu return_properties=True si fara included_properties:
+        altfel valorile sunt partiale si n-ar trebui sa inlocuiasca GetItemValues.
+        """
+        for rec in (response or {}).get("recomms", []):
+            if rec.get("values"):
+                self.put(rec["id"], rec["values"])
+        return response
+
+    def invalidate(self, item_id: str | None = None):
+        with self._lock:
+            if item_id is None:
+                self._entries.clear()
+                self.bytes = 0
+            elif item_id in self._entries:
+                self._drop(item_id)
+
+    def _drop(self, item_id: str):
+        _, size, _ = self._entries.pop(item_id)
+        self.bytes -= size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def shared_cache() -> ItemCache:
+    """Cache-ul procesului (supravietuieste rerun-urilor Streamlit, ca si clientul)."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ItemCache(
+                ttl_s=env_float("ITEM_CACHE_TTL_S", DEFAULT_TTL_S),
+                max_bytes=int(env_float("ITEM_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+            )
+        return _shared
+
+
+def get_item_values(send, item_id: str, cache: ItemCache | None = None) -> dict:
+    """
+    GetItemValues prin cache: `send` e client.send (sau un wrapper cu retry);
+    erorile (ex. 404) se propaga si nu se cache-uiesc.
+    """
+    cache = shared_cache() if cache is None else cache
+    values = cache.get(item_id)
+    if values is None:
+        values = send(GetItemValues(item_id))
+        cache.put(item_id, values)
+    return values
+
+
+def get_many_item_values(send, item_ids: list, cache: ItemCache | None = None) -> dict:
+    """
+    Valorile mai multor carti: cele din cache fara retea, restul intr-un
+    singur Batch (un singur round trip). Intoarce {item_id: values} doar
+    pentru cartile gasite; cele inexistente (404) lipsesc, orice alta eroare
+    (5xx, 429...) e ridicata ca ResponseException, ca in cererea simpla.
+    """
+    cache = shared_cache() if cache is None else cache
+    found = {}
+    missing = []
+    for item_id in dict.fromkeys(item_ids):
+        values = cache.get(item_id)
+        if values is None:
+            missing.append(item_id)
+        else:
+            found[item_id] = values
+
+    if len(missing) == 1:
+        # o singura carte: cererea simpla, fara overhead-ul unui Batch
+        try:
+            found[missing[0]] = get_item_values(send, missing[0], cache)
+        except ResponseException as e:
+            if e.status_code != 404:
+                raise
+    elif missing:
+        requests = [GetItemValues(item_id) for item_id in missing]
+        response = send(Batch(requests))
+        for item_id, req, result in zip(missing, requests, response):
+            code = result.get("code", 500)
+            if 200 <= code < 300:
+                found[item_id] = result["json"]
+                cache.put(item_id, result["json"])
+            elif code != 404:
+                raise ResponseException(req, code, json.dumps(result.get("json")))
+    return found
@@ -1,18 +1,27 @@
+import argparse
+import hashlib
+import json
+import multiprocessing
 import os
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from recombee_api_client.api_client import RecombeeClient, Region
-from recombee_api_client.api_requests import AddItem, SetItemValues, Batch
+from recombee_api_client.api_requests import AddItem, DeleteItem, SetItemValues, Batch
+from recombee_api_client.exceptions import ApiTimeoutException
 
+import catalog
+from catalog import CSV_PATH
+from metrics import Metrics, summary
+from recombee_client import is_transient, make_client
 
 load_dotenv()
 
-client = RecombeeClient(
-        os.environ["RECOMBEE_DB_ID"],
-        os.environ["RECOMBEE_API_TOKEN"],
-        region=Region[os.environ.get("RECOMBEE_REGION", "EU_WEST")],
-)
-
+BATCH_SIZE = 500  # carti per batch (nu sub-cereri)
+CHECKPOINT_PATH = "load_books.checkpoint.json"
+DEAD_LETTER_PATH = "load_books.dead_letter.jsonl"
 
 def safe_float(x):
     try:
@@ -30,102 +39,912 @@ def safe_int(x):
         return None
 
 
-def main():
-    df = pd.read_csv("books_1.Best_Books_Ever.csv")
+def read_books(path: str = CSV_PATH, chunksize: int | None = None, use_cache: bool = True,
+               metrics: Metrics | None = None, keep=None):
+    """
+    Frame-urile pregatite de trimis. Cu `chunksize` citim CSV-ul pe bucati
+    (memorie constanta, fara cache); altfel un singur frame, din cache-ul
+    columnar al catalogului daca e valid. keep(df) -> masca booleana
+    (ex. shard-ul procesului); pe bucati se aplica inainte de pregatire.
+    """
+    if chunksize:
+        yield from catalog.iter_frames(path, chunksize=chunksize, metrics=metrics, keep=keep)
+        return
+    metrics = metrics or Metrics()
+    with metrics.stage("load_catalog"):
+        df = catalog.load_catalog(path, use_cache=use_cache)
+    if keep is not None:
+        with metrics.stage("shard_filter"):
+            df = df[keep(df)]
+    yield df
 
-    # derivam anul publicarii din firstPublishDate / publishDate
-    for col in ["firstPublishDate", "publishDate"]:
-        if col in df.columns:
-            df[col] = pd.to_datetime(df[col], errors="coerce")
 
-    df["publish_year"] = df["firstPublishDate"].dt.year.fillna(
-        df["publishDate"].dt.year
-    )
+# ---------- conversie pe coloane ----------
 
-    # lungimea descrierii
-    df["description_len"] = df["description"].fillna("").astype(str).str.len()
+def _text_column(df: pd.DataFrame, col: str, default=None) -> list:
+    """Coloana text -> lista de str, cu NaN inlocuit de `default`."""
+    if col not in df.columns:
+        return [default] * len(df)
+    s = df[col]
+    return s.astype(object).where(s.notna(), default).tolist()
 
-    # popularitate simpla = numRatings
-    df["popularity"] = df["numRatings"].fillna(0)
 
-    BATCH_SIZE = 500
-    batch_requests = []
+def _float_column(df: pd.DataFrame, col: str) -> list:
+    """Echivalentul vectorizat al safe_float (NaN / invalid -> None)."""
+    if col not in df.columns:
+        return [None] * len(df)
+    s = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    return s.astype(object).where(s.notna(), None).tolist()
 
-    for _, row in df.iterrows():
-        item_id = str(row["bookId"])
 
-        # genuri ca set (lista) – daca sunt separate prin '|'
-        if pd.notna(row.get("genres")):
-            genres = str(row["genres"]).split("|")
-        else:
-            genres = []
+def _int_column(df: pd.DataFrame, col: str) -> list:
+    """Echivalentul vectorizat al safe_int (NaN / invalid -> None)."""
+    if col not in df.columns:
+        return [None] * len(df)
+    s = np.trunc(pd.to_numeric(df[col], errors="coerce").astype("float64"))
+    s = s.astype("Int64")
+    return s.astype(object).where(s.notna(), None).tolist()
 
-        # premii – flag simplu
-        has_awards = (
-            pd.notna(row.get("awards"))
-            and str(row["awards"]).strip() != ""
-        )
 
-        props = {
-            "title": row["title"],
-            "author": row["author"],
-            "series": (
-                row["series"] if pd.notna(row.get("series")) else None
-            ),
-            "genres": genres,
-            "language": (
-                row["language"] if pd.notna(row.get("language")) else None
-            ),
-            "book_format": (
-                row["bookFormat"]
-                if pd.notna(row.get("bookFormat"))
-                else None
-            ),
-            "publisher": (
-                row["publisher"]
-                if pd.notna(row.get("publisher"))
-                else None
-            ),
-            "description": (
-                row["description"]
-                if pd.notna(row.get("description"))
-                else ""
-            ),
-
-            # numerice
-            "pages": safe_int(row.get("pages")),
-            "avg_rating": safe_float(row.get("rating")),
-            "num_ratings": safe_int(row.get("numRatings")),
-            "liked_percent": safe_float(row.get("likedPercent")),
-            "bbe_score": safe_float(row.get("bbeScore")),
-            "bbe_votes": safe_int(row.get("bbeVotes")),
-            "price": safe_float(row.get("price")),
-            "publish_year": safe_int(row.get("publish_year")),
-            "description_len": safe_int(row.get("description_len")),
-            "popularity": safe_float(row.get("popularity")),
-            "has_awards": bool(has_awards),
-        }
+def _list_column(df: pd.DataFrame, col: str) -> list:
+    if col not in df.columns:
+        return [[] for _ in range(len(df))]
+    return [list(v) for v in df[col].tolist()]
+
+
+def _bool_column(df: pd.DataFrame, col: str) -> list:
+    if col not in df.columns:
+        return [False] * len(df)
+    return df[col].fillna(False).astype(bool).tolist()
+
+
+def build_props_columns(df: pd.DataFrame) -> dict:
+    """
+    Conversia tuturor proprietatilor Recombee pe coloane intregi
+    (fara iterrows), dintr-un frame pregatit de catalog.prepare(). Intoarce {nume_proprietate: lista_de_valori},
+    toate listele avand lungimea len(df) si valori Python native.
+    """
+    return {
+        "title": _text_column(df, "title"),
+        "author": _text_column(df, "author"),
+        "series": _text_column(df, "series"),
+        "genres": _list_column(df, "genres"),
+        "language": _text_column(df, "language"),
+        "book_format": _text_column(df, "bookFormat"),
+        "publisher": _text_column(df, "publisher"),
+        "description": _text_column(df, "description", default=""),
+
+        # numerice
+        "pages": _int_column(df, "pages"),
+        "avg_rating": _float_column(df, "rating"),
+        "num_ratings": _int_column(df, "numRatings"),
+        "liked_percent": _float_column(df, "likedPercent"),
+        "bbe_score": _float_column(df, "bbeScore"),
+        "bbe_votes": _int_column(df, "bbeVotes"),
+        "price": _float_column(df, "price"),
+        "publish_year": _int_column(df, "publish_year"),
+        "description_len": _int_column(df, "description_len"),
+        "popularity": _float_column(df, "popularity"),
+        "has_awards": _bool_column(df, "has_awards"),
+    }
+
+
+def iter_props(df: pd.DataFrame):
+    """Genereaza (item_id, props) din coloanele pregatite."""
+    columns = build_props_columns(df)
+    names = list(columns.keys())
+    item_ids = df["bookId"].astype(str).tolist()
+    for item_id, values in zip(item_ids, zip(*columns.values())):
+        yield item_id, dict(zip(names, values))
+
+
+class PropsTable:
+    """
+    Proprietatile unui frame, convertite o data pe coloane intregi; dict-ul
+    unei carti se face apoi din listele gata convertite, in microsecunde
+    (iter_props pe cateva randuri costa milisecunde: conversia per coloana
+    are un cost fix mare). Pentru citiri repetate: cautari, recomandari locale.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.columns = build_props_columns(df)
+        self.names = list(self.columns)
+        self._rows = {}
+        for i, item_id in enumerate(df["bookId"].astype(str).tolist()):
+            self._rows.setdefault(item_id, i)  # bookId duplicat: prima aparitie
+
+    def __contains__(self, item_id):
+        return item_id in self._rows
+
+    def get(self, item_ids: list) -> dict:
+        """{item_id: props} pentru id-urile cunoscute."""
+        columns = list(self.columns.values())
+        out = {}
+        for item_id in item_ids:
+            i = self._rows.get(item_id)
+            if i is not None:
+                out[item_id] = dict(zip(self.names, [col[i] for col in columns]))
+        return out
+
 
+def props_hash(props: dict) -> str:
+    data = json.dumps(props, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class Manifest:
+    """
+    Manifest local bookId -> hash(props) de la ultima rulare reusita.
+    Ne spune ce carti sunt noi, modificate sau disparute din CSV; fisierul
+    e rescris (atomic) doar prin save(), dupa ce batch-urile au fost trimise.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.hashes = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.hashes = json.load(f)
+        self._seen = {}
+        self._failed = set()
+
+    def status(self, item_id: str, props: dict) -> str:
+        """Intoarce 'new', 'changed' sau 'same' si retine hash-ul curent."""
+        h = props_hash(props)
+        old = self.hashes.get(item_id)
+        self._seen[item_id] = h
+        if old is None:
+            return "new"
+        return "same" if old == h else "changed"
+
+    def discard(self, item_id: str):
+        """
+        Sub-cererea cartii a esuat (a ajuns in dead letter): cartea e in CSV, dar
+        pastram hash-ul vechi, ca rularea urmatoare s-o vada din nou ca noua /
+        modificata.
+        """
+        self._failed.add(item_id)
+
+    def missing_ids(self) -> list:
+        """Id-urile din manifest care nu mai apar in CSV (cele esuate apar, deci nu se sterg)."""
+        return [item_id for item_id in self.hashes if item_id not in self._seen and item_id not in self._failed]
+
+    def save(self, deleted=()):
+        deleted = set(deleted)
+        hashes = {k: v for k, v in self.hashes.items() if k not in deleted}
+        hashes.update((k, v) for k, v in self._seen.items() if k not in self._failed)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(hashes, f)
+        os.replace(tmp, self.path)
+        self.hashes = hashes
+
+
+def iter_book_requests(df: pd.DataFrame, manifest: Manifest | None = None, add_item: bool = False,
+                       seen_ids: set | None = None):
+    """
+    Genereaza (pozitie_in_df, [cereri]) pentru fiecare carte din frame.
+    Cartile nemodificate fata de manifest vin cu lista goala, ca pozitia
+    sa ramana utila pentru checkpoint. La fel un bookId deja intalnit in
+    `seen_ids` (si intre bucati): pastram primul rand, ca PropsTable si
+    indexurile locale, deci manifestul si Recombee vad aceleasi valori.
+
+    SetItemValues(cascade_create=True) creeaza singur itemul, deci AddItem
+    se trimite doar cu add_item=True (si atunci doar pentru carti noi).
+    """
+    for pos, (item_id, props) in enumerate(iter_props(df)):
+        if seen_ids is not None:
+            if item_id in seen_ids:
+                yield pos, []  # bookId duplicat: doar prima aparitie
+                continue
+            seen_ids.add(item_id)
+        status = "new"
+        if manifest is not None:
+            status = manifest.status(item_id, props)
+            if status == "same":
+                yield pos, []
+                continue
+
+        reqs = []
         # 1) adaugam itemul (daca nu exista)
-        batch_requests.append(AddItem(item_id))
+        if add_item and status == "new":
+            reqs.append(AddItem(item_id))
 
         # 2) setam proprietatile
-        batch_requests.append(
+        reqs.append(
             SetItemValues(
                 item_id,
                 props,
                 cascade_create=True,  # in caz ca exista item nou
             )
         )
+        yield pos, reqs
+
+
+# ---------- checkpoint + dead letter ----------
+
+class Checkpoint:
+    """
+    Cate randuri din CSV au fost confirmate complet de Recombee.
+    Fisierul e rescris atomic dupa fiecare batch confirmat si sters
+    la finalul unei rulari reusite. Retine si hash-ul CSV-ului: daca
+    fisierul s-a schimbat intre timp, randurile nu mai corespund si
+    o luam de la inceput.
+    """
+
+    def __init__(self, path: str, csv_path: str):
+        self.path = path
+        self.csv_path = os.path.abspath(csv_path)
+        self.csv_sha = catalog.file_hash(csv_path)
+        self.rows_done = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("csv") != self.csv_path:
+                raise SystemExit(
+                    f"Checkpoint-ul {path} e pentru {data.get('csv')}, nu pentru {self.csv_path}. "
+                    "Sterge-l sau foloseste --restart."
+                )
+            if data.get("sha") != self.csv_sha:
+                print(f"CSV-ul s-a schimbat de la checkpoint-ul {path}; il ignoram si o luam de la inceput.")
+                return
+            self.rows_done = int(data.get("rows_done", 0))
+
+    def save(self, rows_done: int):
+        self.rows_done = rows_done
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"csv": self.csv_path, "sha": self.csv_sha, "rows_done": rows_done}, f)
+        os.replace(tmp, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# tipurile de cereri pe care le producem, ca sa le putem reconstrui la replay
+_REQUEST_TYPES = {
+    "AddItem": lambda d: AddItem(d["item_id"]),
+    "DeleteItem": lambda d: DeleteItem(d["item_id"]),
+    "SetItemValues": lambda d: SetItemValues(d["item_id"], d["values"], cascade_create=d.get("cascade_create")),
+}
+
+
+def request_to_dict(req) -> dict:
+    d = {"type": type(req).__name__, "item_id": req.item_id}
+    if isinstance(req, SetItemValues):
+        d["values"] = req.values
+        d["cascade_create"] = req.cascade_create
+    return d
+
+
+def request_from_dict(d: dict):
+    return _REQUEST_TYPES[d["type"]](d)
+
+
+class DeadLetter:
+    """
+    Fisier JSON lines cu sub-cererile respinse de Recombee (cate una pe linie),
+    care poate fi retrimis separat cu --replay. Fisierul e creat doar la
+    primul esec.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+        self._f = None
+
+    def write(self, req, code, error):
+        if self._f is None:
+            self._f = open(self.path, "a", encoding="utf-8")
+        entry = {"request": request_to_dict(req), "code": code, "error": error}
+        self._f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+        self._f.flush()
+        self.count += 1
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    @staticmethod
+    def load(path: str) -> list:
+        with open(path, encoding="utf-8") as f:
+            return [request_from_dict(json.loads(line)["request"]) for line in f if line.strip()]
+
+
+# ---------- dimensionare adaptiva ----------
+
+def estimate_request_bytes(req) -> int:
+    """Estimare ieftina a marimii serializate (fara json.dumps pe fiecare carte)."""
+    size = 64 + len(req.item_id)
+    values = getattr(req, "values", None)
+    if values:
+        for key, v in values.items():
+            size += len(key) + 6
+            if isinstance(v, str):
+                size += len(v)
+            elif isinstance(v, list):
+                size += sum(len(str(x)) + 4 for x in v)
+            else:
+                size += 12
+    return size
+
+
+class AdaptiveBatchSizer:
+    """
+    Alege cate carti intra in urmatorul batch, dupa latenta si throughput-ul
+    observate (hill climbing, cu scadere multiplicativa pe probleme):
+
+    - timeout sau latenta peste `target_latency` -> limita se injumatateste;
+    - la fiecare `window` batch-uri confirmate masuram throughput-ul real:
+      carti confirmate / secunde de ceas de la masuratoarea anterioara (cu
+      --workers > 1 batch-urile se suprapun, deci carti / latenta unui
+      singur batch nu e throughput); cel putin cat la pasul anterior ->
+      continuam in aceeasi directie (+25% sau -20%); clar mai slab ->
+      schimbam directia.
+    Independent de numarul de carti, un batch se inchide cand estimarea
+    payload-ului trece de `max_bytes` (descrierile lungi fac batch-uri grele).
+    """
+
+    def __init__(self, start: int = BATCH_SIZE, min_books: int = 25, max_books: int = 5000,
+                 max_bytes: int = 4 * 1024 * 1024, target_latency: float = 5.0, window: int = 1):
+        self.limit = start
+        self.min_books = min_books
+        self.max_books = max_books
+        self.max_bytes = max_bytes
+        self.target_latency = target_latency
+        self.window = max(1, window)
+        self._direction = 1
+        self._last_rate = None
+        self._window_start = None  # momentul de la care numaram cartile confirmate
+        self._window_books = 0
+        self._window_batches = 0
+        self.history = []  # (carti, bytes, latenta_s)
+
+    def full(self, books: int, nbytes: int) -> bool:
+        return books >= self.limit or nbytes >= self.max_bytes
+
+    def observe(self, requests: list, latency: float, timed_out: bool = False):
+        books = len({r.item_id for r in requests})
+        nbytes = sum(estimate_request_bytes(r) for r in requests)
+        self.history.append((books, nbytes, latency))
+        now = time.perf_counter()
+
+        if timed_out or latency > self.target_latency:
+            self._direction = -1
+            self._last_rate = None
+            self._window_start, self._window_books, self._window_batches = now, 0, 0
+            self.limit = max(self.min_books, self.limit // 2)
+            return
+
+        if self._window_start is None:
+            self._window_start = now - latency  # primul batch: de cand a plecat
+        self._window_books += books
+        self._window_batches += 1
+        if self._window_batches < self.window:
+            return
+        rate = self._window_books / max(now - self._window_start, 1e-6)
+        self._window_start, self._window_books, self._window_batches = now, 0, 0
+        # toleranta de 10%, ca zgomotul retelei sa nu intoarca directia la fiecare pas
+        if self._last_rate is not None and rate < 0.9 * self._last_rate:
+            self._direction = -self._direction
+        self._last_rate = rate
+
+        factor = 1.25 if self._direction > 0 else 0.8
+        self.limit = int(min(self.max_books, max(self.min_books, self.limit * factor)))
+
+    def report(self) -> str:
+        if not self.history:
+            return "Adaptive batching: niciun batch trimis."
+        sizes = sorted(h[0] for h in self.history)
+        books = sum(sizes)
+        nbytes = sum(h[1] for h in self.history)
+        busy = sum(h[2] for h in self.history)
+        return (
+            f"Adaptive batching: {len(sizes)} batch-uri, carti/batch min={sizes[0]} "
+            f"median={sizes[len(sizes) // 2]} max={sizes[-1]}, limita finala={self.limit}; "
+            f"{books / busy:.0f} carti/s, {nbytes / busy / 1e6:.2f} MB/s (timp de trimitere)"
+        )
+
+
+def _is_ok(req, result: dict) -> bool:
+    code = result.get("code", 200)
+    if 200 <= code < 300:
+        return True
+    # AddItem pe un item existent (rulari repetate fara manifest)
+    return code == 409 and isinstance(req, AddItem)
+
+
+class BatchDispatcher:
+    """
+    Trimite batch-uri catre Recombee cu cel mult `workers` batch-uri in zbor.
+
+    - submit() blocheaza cat timp sunt deja `workers` batch-uri neconfirmate
+      (backpressure: producatorul nu poate o lua inaintea retelei);
+    - `acked` = cate batch-uri consecutive, in ordinea submit(), au primit
+      raspuns; batch-urile terminate mai devreme asteapta golurile din fata.
+      La fiecare avans apelam on_ack(end_row) cu `end_row` al ultimului
+      batch confirmat (folosit pentru checkpoint);
+    - raspunsul fiecarui batch e verificat per sub-cerere, iar cele esuate
+      ajung in `dead_letter` si in on_failure(req), daca e dat. Erorile tranzitorii ale batch-ului intreg se
+      reincearca de `tries` ori, apoi exceptia e propagata;
+    - dupa fiecare batch apelam on_result(requests, latenta_s, timeout),
+      unde `timeout` spune daca vreo incercare a expirat;
+    - in `metrics` numaram batch-urile, sub-cererile, esecurile, reincercarile
+      si bytes-ii estimati, iar latenta fiecarui batch intra in histograma
+      batch_latency.
+    Cu workers=1 trimiterea e sincrona, exact ca inainte.
+    """
+
+    def __init__(self, client, workers: int = 1, on_ack=None, dead_letter: DeadLetter | None = None,
+                 tries: int = 3, base_sleep: float = 0.5, on_result=None, metrics: Metrics | None = None,
+                 on_failure=None):
+        self.client = client
+        self.workers = max(1, workers)
+        self.on_ack = on_ack
+        self.on_result = on_result
+        self.on_failure = on_failure
+        self.dead_letter = dead_letter
+        self.tries = tries
+        self.base_sleep = base_sleep
+        self.metrics = metrics or Metrics()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        self._inflight = {}  # future -> (seq, requests, end_row)
+        self._done = {}  # seq terminate, dar inca neconsecutive -> end_row
+        self.submitted = 0
+        self.acked = 0
+        self.failed = 0
+
+    def submit(self, requests: list, end_row: int | None = None):
+        seq = self.submitted
+        self.submitted += 1
+
+        if self._pool is None:
+            self._finish(seq, requests, end_row, *self._send(requests))
+            return
+
+        while len(self._inflight) >= self.workers:
+            self._wait(FIRST_COMPLETED)
+        future = self._pool.submit(self._send, requests)
+        self._inflight[future] = (seq, requests, end_row)
+
+    def _send(self, requests: list):
+        timed_out = False
+        for i in range(self.tries):
+            t0 = time.perf_counter()
+            try:
+                response = self.client.send(Batch(requests))
+                return response, time.perf_counter() - t0, timed_out
+            except Exception as e:
+                if isinstance(e, ApiTimeoutException):
+                    timed_out = True
+                    self.metrics.inc("timeouts")
+                if i == self.tries - 1 or not is_transient(e):
+                    self.metrics.inc("batch_errors")
+                    raise
+                self.metrics.inc("retries")
+                time.sleep(self.base_sleep * (2**i))
+
+    def _wait(self, return_when):
+        done, _ = wait(list(self._inflight), return_when=return_when)
+        for future in done:
+            seq, requests, end_row = self._inflight.pop(future)
+            self._finish(seq, requests, end_row, *future.result())  # propagam eroarea batch-ului
+
+    def _finish(self, seq: int, requests: list, end_row, response, latency: float, timed_out: bool):
+        if self.on_result is not None:
+            self.on_result(requests, latency, timed_out)
+        self.metrics.observe("batch_latency", latency)
+        self.metrics.inc("batches")
+        self.metrics.inc("sub_requests", len(requests))
+        self.metrics.inc("payload_bytes", sum(estimate_request_bytes(r) for r in requests))
+        for req, result in zip(requests, response or []):
+            if not _is_ok(req, result):
+                self.failed += 1
+                self.metrics.inc("sub_requests_failed")
+                if self.dead_letter is not None:
+                    self.dead_letter.write(req, result.get("code"), result.get("json"))
+                if self.on_failure is not None:
+                    self.on_failure(req)
+
+        self._done[seq] = end_row
+        last = None
+        while self.acked in self._done:
+            last = self._done.pop(self.acked)
+            self.acked += 1
+        if last is not None and self.on_ack is not None:
+            self.on_ack(last)
+
+    def close(self, raise_errors: bool = True):
+        """Asteapta toate batch-urile ramase in zbor."""
+        try:
+            while self._inflight:
+                try:
+                    self._wait(FIRST_COMPLETED)
+                except Exception:
+                    if raise_errors:
+                        raise
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # daca deja am esuat, doar confirmam ce a mai ajuns, fara erori noi
+        self.close(raise_errors=exc_type is None)
+
+
+def replay_dead_letter(client, path: str, workers: int = 1, metrics: Metrics | None = None):
+    """Retrimite cererile din dead letter; ce esueaza din nou ramane in fisier."""
+    requests = DeadLetter.load(path)
+    retry = DeadLetter(path + ".retry")
+    try:
+        with BatchDispatcher(client, workers=workers, dead_letter=retry, metrics=metrics) as dispatcher:
+            for i in range(0, len(requests), BATCH_SIZE):
+                dispatcher.submit(requests[i:i + BATCH_SIZE])
+    finally:
+        retry.close()
+
+    if retry.count:
+        os.replace(retry.path, path)
+    else:
+        os.remove(path)
+    print(f"Replay: {len(requests) - retry.count}/{len(requests)} cereri trimise, {retry.count} raman in {path}.")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Incarca cartile din CSV in Recombee.")
+    parser.add_argument("--csv", default=CSV_PATH)
+    parser.add_argument(
+        "--chunksize", type=int, default=None,
+        help="citeste CSV-ul in bucati de N randuri (memorie constanta)",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="parseaza CSV-ul direct, fara cache-ul columnar din catalog.py",
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="cate batch-uri pot fi in zbor simultan",
+    )
+    parser.add_argument(
+        "--processes", type=int, default=1,
+        help="imparte catalogul dupa hash(bookId) intre N procese",
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=BATCH_SIZE,
+        help="cate carti intra intr-un batch",
+    )
+    parser.add_argument(
+        "--adaptive", action="store_true",
+        help="ajusteaza marimea batch-urilor dupa latenta si bytes (porneste de la --batch-size)",
+    )
+    parser.add_argument(
+        "--max-batch-bytes", type=int, default=4 * 1024 * 1024,
+        help="cu --adaptive: marimea maxima estimata a unui batch",
+    )
+    parser.add_argument(
+        "--add-item", action="store_true",
+        help="trimite si AddItem explicit pentru cartile noi (vechiul comportament)",
+    )
+    parser.add_argument(
+        "--manifest", default=None,
+        help="fisier JSON cu hash-urile trimise; trimitem doar cartile noi/modificate",
+    )
+    parser.add_argument(
+        "--delete-missing", action="store_true",
+        help="cu --manifest: DeleteItem pentru cartile care nu mai sunt in CSV",
+    )
+    parser.add_argument(
+        "--checkpoint", default=CHECKPOINT_PATH,
+        help="fisierul de checkpoint; o rulare intrerupta continua de acolo ('' = dezactivat)",
+    )
+    parser.add_argument("--restart", action="store_true", help="ignora checkpoint-ul existent")
+    parser.add_argument(
+        "--dead-letter", default=DEAD_LETTER_PATH,
+        help="unde scriem sub-cererile respinse de Recombee",
+    )
+    parser.add_argument("--replay", action="store_true", help="retrimite doar cererile din --dead-letter")
+    parser.add_argument(
+        "--metrics", default=None,
+        help="scrie metricile rularii (etape, latente, contoare) in acest fisier",
+    )
+    parser.add_argument(
+        "--metrics-format", choices=["prom", "jsonl"], default="prom",
+        help="prom = text Prometheus (rescris), jsonl = cate o linie JSON per scriere",
+    )
+    parser.add_argument(
+        "--metrics-interval", type=float, default=0.0,
+        help="cu --metrics: scrie si in timpul rularii, la fiecare N secunde",
+    )
+    return parser
+
+
+def shard_of(item_ids: pd.Series, shards: int) -> np.ndarray:
+    """Shard-ul fiecarui bookId: crc32 % shards (stabil intre procese si rulari)."""
+    return np.fromiter(
+        (zlib.crc32(i.encode("utf-8")) % shards for i in item_ids.astype(str)),
+        dtype=np.int64, count=len(item_ids),
+    )
+
+
+def _shard_path(path: str, shard: tuple | None) -> str:
+    if not path or shard is None:
+        return path
+    k, n = shard
+    return f"{path}.shard{k}-of-{n}"
+
+
+def ingest(args, client, manifest: Manifest | None = None, shard: tuple | None = None, progress=None,
+           metrics: Metrics | None = None) -> dict:
+    """
+    Citeste catalogul, pastreaza doar cartile din `shard` = (k, n) daca e dat,
+    si trimite batch-urile. Checkpoint-ul si dead letter-ul sunt per shard.
+    progress(rows_done), daca e dat, e apelat la fiecare avans confirmat.
+    Intoarce un raport (dict) cu ce s-a trimis, inclusiv snapshot-ul metricilor.
+    Etapele masurate: citirea (read_csv / derive_columns / clean_columns sau
+    load_catalog), transform (props + cereri) si submit (timpul in care
+    producatorul asteapta dispatcher-ul: trimitere sincrona sau backpressure).
+    """
+    t0 = time.perf_counter()
+    metrics = metrics or Metrics()
+    checkpoint_path = _shard_path(args.checkpoint, shard)
+    if args.restart and checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    checkpoint = Checkpoint(checkpoint_path, args.csv) if checkpoint_path else None
+    start_row = checkpoint.rows_done if checkpoint else 0
+    if start_row:
+        print(f"Reluam de la randul {start_row} (checkpoint {checkpoint_path}).")
+
+    def on_ack(rows_done):
+        if checkpoint is not None:
+            checkpoint.save(rows_done)
+        if progress is not None:
+            progress(rows_done)
+
+    dead_letter = DeadLetter(_shard_path(args.dead_letter, shard))
+    sizer = AdaptiveBatchSizer(
+        start=args.batch_size, max_bytes=args.max_batch_bytes, window=2 * args.workers,
+    ) if args.adaptive else None
+    batch_requests = []
+    batch_books = 0
+    batch_bytes = 0
+    books = 0
+    row = 0  # pozitia in CSV (in cadrul shard-ului, daca e cazul)
+    seen_ids = set()  # bookId-uri deja intalnite in rularea asta (duplicatele se sar)
+
+    try:
+        with BatchDispatcher(
+            client,
+            workers=args.workers,
+            on_ack=on_ack,
+            dead_letter=dead_letter,
+            on_result=sizer.observe if sizer else None,
+            metrics=metrics,
+            on_failure=(lambda req: manifest.discard(req.item_id)) if manifest is not None else None,
+        ) as dispatcher:
+            # fiecare bucata e trimisa inainte sa citim urmatoarea
+            keep = (lambda df: shard_of(df["bookId"], shard[1]) == shard[0]) if shard is not None else None
+            frames = read_books(args.csv, chunksize=args.chunksize, use_cache=not args.no_cache,
+                                metrics=metrics, keep=keep)
+            for df in frames:
+                chunk_start = row
+                row += len(df)
+                metrics.inc("rows", len(df))
+                if row <= start_row and manifest is None:
+                    seen_ids.update(df["bookId"].astype(str))
+                    continue
+
+                # transform = tot ce e in bucla, mai putin submit()
+                t_transform = time.perf_counter()
+                for pos, reqs in iter_book_requests(df, manifest, add_item=args.add_item, seen_ids=seen_ids):
+                    if chunk_start + pos < start_row or not reqs:
+                        continue  # confirmat deja / nimic de trimis
+                    batch_requests.extend(reqs)
+                    batch_books += 1
+                    books += 1
+
+                    # trimitem in batch-uri de cate `batch_size` carti (sau cat zice sizer-ul)
+                    if sizer is not None:
+                        batch_bytes += sum(estimate_request_bytes(r) for r in reqs)
+                        full = sizer.full(batch_books, batch_bytes)
+                    else:
+                        full = batch_books >= args.batch_size
+                    if full:
+                        metrics.add_time("transform", time.perf_counter() - t_transform)
+                        with metrics.stage("submit"):
+                            dispatcher.submit(batch_requests, end_row=chunk_start + pos + 1)
+                        t_transform = time.perf_counter()
+                        batch_requests = []
+                        batch_books = 0
+                        batch_bytes = 0
+                metrics.add_time("transform", time.perf_counter() - t_transform)
+
+            # ce a mai ramas
+            with metrics.stage("submit"):
+                if batch_requests:
+                    dispatcher.submit(batch_requests, end_row=row)
+                dispatcher.close()  # asteptam batch-urile din zbor
+    finally:
+        dead_letter.close()
+        metrics.inc("books", books)
+
+    # ajungem aici doar daca toate batch-urile au trecut
+    if checkpoint is not None:
+        checkpoint.clear()
+    return {
+        "shard": shard[0] if shard else None,
+        "rows": row,
+        "books": books,
+        "batches": dispatcher.submitted,
+        "failed": dead_letter.count,
+        "dead_letter": dead_letter.path,
+        "seconds": time.perf_counter() - t0,
+        "batching": sizer.report() if sizer else None,
+        "metrics": metrics.snapshot(),
+    }
+
+
+def delete_missing(args, client, manifest: Manifest, metrics: Metrics | None = None) -> list:
+    """
+    DeleteItem pentru id-urile din manifest care nu au mai aparut in CSV.
+    Intoarce doar id-urile sterse efectiv; cele esuate raman in manifest.
+    """
+    missing = manifest.missing_ids()
+    failed = set()
+    dead_letter = DeadLetter(args.dead_letter)
+    try:
+        with BatchDispatcher(client, workers=args.workers, dead_letter=dead_letter, metrics=metrics,
+                             on_failure=lambda req: failed.add(req.item_id)) as dispatcher:
+            for i in range(0, len(missing), args.batch_size):
+                dispatcher.submit([DeleteItem(item_id) for item_id in missing[i:i + args.batch_size]])
+    finally:
+        dead_letter.close()
+    return [item_id for item_id in missing if item_id not in failed]
+
+
+def print_report(report: dict):
+    prefix = f"[shard {report['shard']}] " if report.get("shard") is not None else ""
+    print(
+        f"{prefix}{report['rows']} randuri, {report['books']} carti trimise in "
+        f"{report['batches']} batch-uri, {report['seconds']:.1f} s"
+    )
+    if report.get("metrics"):
+        print(prefix + summary(report["metrics"]))
+    if report.get("batching"):
+        print(prefix + report["batching"])
+    if report["failed"]:
+        print(f"{prefix}{report['failed']} sub-cereri esuate scrise in {report['dead_letter']} (reia cu --replay).")
+
+
+# ---------- mod multi-proces ----------
+
+_progress_queue = None
+
+
+def _init_worker(queue):
+    global _progress_queue
+    _progress_queue = queue
+
+
+def _ingest_shard(args, k: int, n: int) -> dict:
+    """
+    Ruleaza intr-un proces separat: client propriu, batch-uri proprii.
+    Cu --metrics-interval, fiecare shard isi scrie metricile live in
+    fisierul lui; coordonatorul le uneste la final.
+    """
+    manifest = Manifest(args.manifest) if args.manifest else None
+    metrics = Metrics(labels={"shard": k})
+    live_path = _shard_path(args.metrics, (k, n)) if args.metrics_interval > 0 else None
+    with metrics.stream(live_path, args.metrics_format, args.metrics_interval):
+        report = ingest(
+            args, make_client(pool_size=args.workers), manifest=manifest, shard=(k, n),
+            progress=lambda rows_done: _progress_queue.put((k, rows_done)),
+            metrics=metrics,
+        )
+    report["seen"] = manifest._seen if manifest is not None else {}
+    report["failed_ids"] = sorted(manifest._failed) if manifest is not None else []
+    return report
+
+
+def _merge_dead_letters(args, reports: list):
+    """Muta dead letter-ele shard-urilor in fisierul principal."""
+    paths = [_shard_path(args.dead_letter, (k, args.processes)) for k in range(args.processes)]
+    with open(args.dead_letter, "a", encoding="utf-8") as out:
+        for path in paths:
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    out.writelines(f)
+                os.remove(path)
+    if os.path.getsize(args.dead_letter) == 0:
+        os.remove(args.dead_letter)
+    for report in reports:
+        report["dead_letter"] = args.dead_letter
+
+
+def run_sharded(args, metrics: Metrics | None = None) -> list:
+    """
+    Imparte catalogul dupa hash(bookId) in `args.processes` shard-uri, fiecare
+    incarcat de un proces separat; coordonatorul afiseaza progresul agregat,
+    strange rapoartele si erorile si le uneste.
+    """
+    n = args.processes
+    if not args.chunksize and not args.no_cache and not catalog.cache_is_valid(args.csv):
+        catalog.build_cache(args.csv)  # o data, inainte ca procesele sa-l citeasca in paralel
+
+    queue = multiprocessing.Queue()
+    acked = [0] * n
+    reports, errors = [], []
+
+    with ProcessPoolExecutor(max_workers=n, initializer=_init_worker, initargs=(queue,)) as pool:
+        futures = {pool.submit(_ingest_shard, args, k, n): k for k in range(n)}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=2.0)
+            while not queue.empty():
+                k, rows_done = queue.get()
+                acked[k] = rows_done
+            print(f"Progres: {sum(acked)} randuri confirmate ({n - len(pending)}/{n} shard-uri gata)")
+            for future in done:
+                try:
+                    reports.append(future.result())
+                except Exception as e:
+                    errors.append((futures[future], e))
+
+    _merge_dead_letters(args, reports)
+    if metrics is not None:
+        for report in reports:
+            metrics.merge(report["metrics"])
+    for report in sorted(reports, key=lambda r: r["shard"]):
+        print_report(report)
+    print(
+        f"Total: {sum(r['books'] for r in reports)} carti, {sum(r['batches'] for r in reports)} batch-uri, "
+        f"{sum(r['failed'] for r in reports)} sub-cereri esuate"
+    )
+    if errors:
+        for k, e in errors:
+            print(f"[shard {k}] a esuat: {e!r} (reia rularea; continua din checkpoint)")
+        raise SystemExit(1)
+    return reports
+
+
+def run(args, client) -> Metrics:
+    """
+    Ruleaza incarcarea cu argumentele deja parsate si un client dat.
+    Intoarce metricile rularii (scrise si in --metrics, daca e dat).
+    """
+    metrics = Metrics()
+    with metrics.stream(args.metrics, args.metrics_format, args.metrics_interval):
+        if args.replay:
+            replay_dead_letter(client, args.dead_letter, workers=args.workers, metrics=metrics)
+            return metrics
+
+        manifest = Manifest(args.manifest) if args.manifest else None
+        if args.processes > 1:
+            reports = run_sharded(args, metrics)
+            if manifest is not None:
+                for report in reports:
+                    manifest._seen.update(report["seen"])
+                    manifest._failed.update(report["failed_ids"])
+        else:
+            print_report(ingest(args, client, manifest=manifest, metrics=metrics))
+
+        deleted = delete_missing(args, client, manifest, metrics) if args.delete_missing else []
+        if manifest is not None:
+            manifest.save(deleted)
+    return metrics
+
 
-        # trimitem in batch-uri
-        if len(batch_requests) >= BATCH_SIZE:
-            client.send(Batch(batch_requests))
-            batch_requests = []
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.delete_missing and not args.manifest:
+        parser.error("--delete-missing necesita --manifest")
 
-    # ce a mai ramas
-    if batch_requests:
-        client.send(Batch(batch_requests))
+    run(args, make_client(pool_size=args.workers))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,327 @@
+"""
+Stand-in local, in-process, pentru RecombeeClient: aceeasi metoda send(request)
+si aceleasi forme de raspuns / exceptii, dar totul tinut in memorie.
+
+Il folosim ca sa masuram si sa testam overhead-ul nostru fara retea si fara
+cota de API (vezi recombee_client.make_client() cu RECOMBEE_LOCAL=1).
+Latenta si erorile se pot injecta, cu seed, ca rularile sa fie reproductibile.
+
+Un server HTTP pe localhost n-ar fi vazut batch-urile: clientul oficial
+trimite Batch mereu pe HTTPS (ensure_https), indiferent de protocolul ales.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+
+from recombee_api_client.exceptions import ApiTimeoutException, ResponseException
+
+from catalog import env_float
+
+
+def _opt(req, name: str):
+    # parametrii nesetati sunt un UUID santinela in clientul oficial
+    value = getattr(req, name, None)
+    return None if isinstance(value, uuid.UUID) else value
+
+
+def _tokens(text) -> set:
+    return set(re.findall(r"\w+", str(text or "").lower()))
+
+
+class _Reject(Exception):
+    """Raspuns de eroare pentru o (sub-)cerere: cod HTTP + mesaj."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class LocalRecombee:
+    """
+    Cererile acoperite: AddItemProperty, AddItem, DeleteItem, SetItemValues,
+    GetItemValues, AddUser, GetUserValues, SetUserValues, AddRating,
+    AddDetailView, SearchItems, RecommendItemsToUser, RecommendItemsToItem
+    si Batch din oricare dintre ele.
+
+    - latency_ms (+/- jitter_ms) pe fiecare send(), plus per_request_ms pentru
+      fiecare sub-cerere dintr-un Batch;
+    - timeout_rate: send() arunca ApiTimeoutException, ca clientul real;
+    - error_rate: send() arunca ResponseException 500; intr-un Batch, fiecare
+      sub-cerere primeste independent code=500 cu aceeasi probabilitate;
+    - store_items=False: AddItem / SetItemValues / DeleteItem sunt doar
+      numarate, nu pastrate (pentru benchmark-uri de memorie ale loader-ului).
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, per_request_ms: float = 0.0,
+                 error_rate: float = 0.0, timeout_rate: float = 0.0, seed: int | None = None,
+                 store_items: bool = True):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.per_request_ms = per_request_ms
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.store_items = store_items
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.item_properties = {}
+        self.items = {}
+        self.users = {}
+        self.ratings = {}  # (user_id, item_id) -> rating
+        self.detail_views = Counter()  # (user_id, item_id) -> vizite
+        self._search_tokens = {}  # item_id -> cuvintele din title/author/series (golit la scriere)
+
+        # statistici pentru benchmark-uri
+        self.calls = Counter()  # tipul cererii -> numar
+        self.batches = 0
+        self.requests = 0  # sub-cereri (un request simplu conteaza 1)
+        self.bytes_in = 0
+        self.latencies = []
+
+    # ---------- transport ----------
+
+    def send(self, request):
+        t0 = time.perf_counter()
+        subs = getattr(request, "requests", None)
+        n = len(subs) if subs is not None else 1
+
+        # serializam corpul ca si clientul real, ca sa platim acelasi cost
+        body = json.dumps(request.get_body_parameters())
+
+        with self._lock:
+            self.calls[type(request).__name__] += 1
+            self.requests += n
+            self.bytes_in += len(body)
+            if subs is not None:
+                self.batches += 1
+            roll = self._rng.random()
+            sub_rolls = [self._rng.random() for _ in range(n)] if subs is not None else None
+            delay = self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)
+
+        delay += self.per_request_ms * n if subs is not None else 0.0
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        try:
+            if roll < self.timeout_rate:
+                raise ApiTimeoutException(request)
+            if roll < self.timeout_rate + self.error_rate:
+                raise ResponseException(request, 500, "injected error")
+
+            if subs is not None:
+                return [self._batch_entry(r, sub_roll) for r, sub_roll in zip(subs, sub_rolls)]
+            try:
+                with self._lock:
+                    return self._handle(request)
+            except _Reject as e:
+                raise ResponseException(request, e.code, e.message)
+        finally:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - t0)
+
+    def _batch_entry(self, req, roll: float) -> dict:
+        if roll < self.error_rate:
+            return {"code": 500, "json": {"error": "injected error", "statusCode": 500}}
+        try:
+            with self._lock:
+                result = self._handle(req)
+            return {"code": 201 if req.method == "put" else 200, "json": result}
+        except _Reject as e:
+            return {"code": e.code, "json": {"error": e.message, "statusCode": e.code}}
+
+    def _handle(self, req):
+        handler = getattr(self, "_on_" + type(req).__name__, None)
+        if handler is None:
+            raise _Reject(400, f"{type(req).__name__} nu e implementat in stand-in")
+        return handler(req)
+
+    # ---------- item-uri / useri ----------
+
+    def _on_AddItemProperty(self, req):
+        if req.property_name in self.item_properties:
+            raise _Reject(409, "property already exists")
+        self.item_properties[req.property_name] = req.type
+        return "ok"
+
+    def _on_AddItem(self, req):
+        if not self.store_items:
+            return "ok"
+        if req.item_id in self.items:
+            raise _Reject(409, "item already exists")
+        self.items[req.item_id] = {}
+        return "ok"
+
+    def _on_DeleteItem(self, req):
+        if not self.store_items:
+            return "ok"
+        if self.items.pop(req.item_id, None) is None:
+            raise _Reject(404, "item not found")
+        self._search_tokens.pop(req.item_id, None)
+        return "ok"
+
+    def _on_SetItemValues(self, req):
+        if not self.store_items:
+            return "ok"
+        if req.item_id not in self.items:
+            if not _opt(req, "cascade_create"):
+                raise _Reject(404, "item not found")
+            self.items[req.item_id] = {}
+        self.items[req.item_id].update(req.values)
+        self._search_tokens.pop(req.item_id, None)
+        return "ok"
+
+    def _on_GetItemValues(self, req):
+        if req.item_id not in self.items:
+            raise _Reject(404, "item not found")
+        return dict(self.items[req.item_id])
+
+    def _on_AddUser(self, req):
+        if req.user_id in self.users:
+            raise _Reject(409, "user already exists")
+        self.users[req.user_id] = {}
+        return "ok"
+
+    def _on_GetUserValues(self, req):
+        if req.user_id not in self.users:
+            raise _Reject(404, "user not found")
+        return dict(self.users[req.user_id])
+
+    def _on_SetUserValues(self, req):
+        if req.user_id not in self.users:
+            if not _opt(req, "cascade_create"):
+                raise _Reject(404, "user not found")
+            self.users[req.user_id] = {}
+        self.users[req.user_id].update(req.values)
+        return "ok"
+
+    # ---------- interactiuni ----------
+
+    def _interaction_target(self, req):
+        if req.user_id not in self.users or req.item_id not in self.items:
+            if not _opt(req, "cascade_create"):
+                raise _Reject(404, "user or item not found")
+            self.users.setdefault(req.user_id, {})
+            self.items.setdefault(req.item_id, {})
+        return req.user_id, req.item_id
+
+    def _on_AddRating(self, req):
+        if not -1.0 <= req.rating <= 1.0:
+            raise _Reject(400, "rating must be in [-1, 1]")
+        self.ratings[self._interaction_target(req)] = req.rating
+        return "ok"
+
+    def _on_AddDetailView(self, req):
+        self.detail_views[self._interaction_target(req)] += 1
+        return "ok"
+
+    # ---------- cautare / recomandari ----------
+
+    def _recomms(self, req, ranked: list) -> dict:
+        count = _opt(req, "count") or 10
+        with_values = bool(_opt(req, "return_properties"))
+        recomms = []
+        for item_id in ranked[:count]:
+            rec = {"id": item_id}
+            if with_values:
+                rec["values"] = dict(self.items[item_id])
+            recomms.append(rec)
+        return {"recommId": str(uuid.uuid4()), "recomms": recomms, "numberNextRecommsCalls": 0}
+
+    def _popularity(self, item_id) -> float:
+        return float(self.items[item_id].get("popularity") or 0)
+
+    def _on_SearchItems(self, req):
+        if req.user_id not in self.users and _opt(req, "cascade_create"):
+            self.users[req.user_id] = {}
+        query = _tokens(req.search_query)
+        if not query:
+            return self._recomms(req, [])
+
+        scored = []
+        for item_id, values in self.items.items():
+            words = self._search_tokens.get(item_id)
+            if words is None:
+                words = self._search_tokens[item_id] = (
+                    _tokens(values.get("title")) | _tokens(values.get("author")) | _tokens(values.get("series"))
+                )
+            hits = len(query & words)
+            if hits:
+                scored.append((hits, self._popularity(item_id), item_id))
+        scored.sort(reverse=True)
+        return self._recomms(req, [item_id for _, _, item_id in scored])
+
+    def _on_RecommendItemsToUser(self, req):
+        profile = self.users.get(req.user_id, {})
+        fav_genres = set(profile.get("fav_genres") or [])
+        fav_authors = set(profile.get("fav_authors") or [])
+        seen = {i for (u, i) in self.ratings if u == req.user_id}
+
+        scored = []
+        for item_id, values in self.items.items():
+            if item_id in seen:
+                continue
+            score = len(fav_genres & set(values.get("genres") or []))
+            score += 3 * (values.get("author") in fav_authors)
+            scored.append((score, self._popularity(item_id), item_id))
+        scored.sort(reverse=True)
+        return self._recomms(req, [item_id for _, _, item_id in scored])
+
+    def _on_RecommendItemsToItem(self, req):
+        if req.item_id not in self.items:
+            if not _opt(req, "cascade_create"):
+                raise _Reject(404, "item not found")
+            self.items[req.item_id] = {}
+        target = self.items[req.item_id]
+        genres = set(target.get("genres") or [])
+
+        scored = []
+        for item_id, values in self.items.items():
+            if item_id == req.item_id:
+                continue
+            score = len(genres & set(values.get("genres") or []))
+            score += 3 * (bool(target.get("author")) and values.get("author") == target.get("author"))
+            if score:
+                scored.append((score, self._popularity(item_id), item_id))
+        scored.sort(reverse=True)
+        return self._recomms(req, [item_id for _, _, item_id in scored])
+
+    # ---------- populare ----------
+
+    def load_catalog(self, path: str | None = None):
+        """Pune in stand-in toate cartile din catalog, cu aceleasi proprietati ca load_books."""
+        import catalog
+        import load_books
+
+        df = catalog.load_catalog(path or catalog.CSV_PATH)
+        with self._lock:
+            for item_id, props in load_books.iter_props(df):
+                self.items[item_id] = props
+            self._search_tokens.clear()
+        return self
+
+
+def from_env() -> LocalRecombee:
+    """
+    Stand-in configurat din variabile de mediu:
+      RECOMBEE_LOCAL_LATENCY_MS, RECOMBEE_LOCAL_JITTER_MS, RECOMBEE_LOCAL_PER_REQUEST_MS,
+      RECOMBEE_LOCAL_ERROR_RATE, RECOMBEE_LOCAL_TIMEOUT_RATE, RECOMBEE_LOCAL_SEED,
+      RECOMBEE_LOCAL_CATALOG=1 (pre-incarca toate cartile din CSV).
+    """
+    seed = os.environ.get("RECOMBEE_LOCAL_SEED", "").strip()
+    client = LocalRecombee(
+        latency_ms=env_float("RECOMBEE_LOCAL_LATENCY_MS"),
+        jitter_ms=env_float("RECOMBEE_LOCAL_JITTER_MS"),
+        per_request_ms=env_float("RECOMBEE_LOCAL_PER_REQUEST_MS"),
+        error_rate=env_float("RECOMBEE_LOCAL_ERROR_RATE"),
+        timeout_rate=env_float("RECOMBEE_LOCAL_TIMEOUT_RATE"),
+        seed=int(seed) if seed else None,
+    )
+    if os.environ.get("RECOMBEE_LOCAL_CATALOG", "").strip() == "1":
+        client.load_catalog()
+    return client
@@ -0,0 +1,235 @@
+"""
+Metrici pentru incarcarea in Recombee: timp per etapa, histograme de
+latenta per batch si contoare (randuri, batch-uri, esecuri, reincercari,
+bytes). Se exporta la final ca text Prometheus sau JSON lines si se pot
+scrie periodic in timpul rularii (stream()).
+
+Totul e in memorie, protejat de un lock: dispatcher-ul raporteaza din
+thread-urile lui, iar in modul multi-proces fiecare shard are propriile
+metrici, unite apoi cu merge().
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = "load_books"
+
+# limitele superioare (secunde) ale bucket-urilor de latenta
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+HELP = {
+    "rows": "randuri citite din CSV",
+    "books": "carti trimise (noi sau modificate)",
+    "batches": "batch-uri trimise cu succes",
+    "batch_errors": "batch-uri esuate definitiv (exceptie propagata)",
+    "sub_requests": "sub-cereri trimise in batch-uri",
+    "sub_requests_failed": "sub-cereri respinse (ajunse in dead letter)",
+    "retries": "reincercari dupa erori tranzitorii",
+    "timeouts": "incercari expirate",
+    "payload_bytes": "marimea estimata a batch-urilor trimise",
+}
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # necumulative
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, upper in enumerate(self.buckets):
+            if value <= upper:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float | None:
+        """Aproximare din bucket-uri: limita superioara a bucket-ului care contine cuantila."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for upper, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return upper
+        return self.buckets[-1]
+
+    def to_dict(self) -> dict:
+        return {
+            # "+Inf" in loc de Infinity, ca JSON-ul sa ramana valid
+            "buckets": [[_le(upper), n] for upper, n in zip(self.buckets, self.counts)],
+            "sum": self.sum,
+            "count": self.count,
+        }
+
+    def merge(self, d: dict):
+        for i, (_, n) in enumerate(d["buckets"]):
+            self.counts[i] += n
+        self.sum += d["sum"]
+        self.count += d["count"]
+
+
+class Metrics:
+    """
+    - inc(nume, n): contor;
+    - stage(nume): context manager care aduna timpul de perete al etapei
+      (sau add_time(nume, secunde) cand masuram manual);
+    - observe(nume, secunde): histograma de latenta.
+    """
+
+    def __init__(self, labels: dict | None = None):
+        self.labels = dict(labels or {})
+        self.counters = {}
+        self.stages = {}  # etapa -> [secunde, apeluri]
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+
+    def inc(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def add_time(self, stage: str, seconds: float, calls: int = 1):
+        with self._lock:
+            entry = self.stages.setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += calls
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - t0)
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            self.histograms.setdefault(name, Histogram()).observe(seconds)
+
+    # ---------- export ----------
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "time": time.time(),
+                "elapsed_s": time.perf_counter() - self._t0,
+                "labels": dict(self.labels),
+                "counters": dict(self.counters),
+                "stages": {k: {"seconds": s, "calls": c} for k, (s, c) in self.stages.items()},
+                "histograms": {k: h.to_dict() for k, h in self.histograms.items()},
+            }
+
+    def merge(self, snapshot: dict):
+        """Aduna metricile altui proces (snapshot() dintr-un shard)."""
+        with self._lock:
+            for name, n in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for name, st in snapshot["stages"].items():
+                entry = self.stages.setdefault(name, [0.0, 0])
+                entry[0] += st["seconds"]
+                entry[1] += st["calls"]
+            for name, h in snapshot["histograms"].items():
+                self.histograms.setdefault(name, Histogram()).merge(h)
+
+    def to_json_line(self) -> str:
+        return json.dumps(self.snapshot(), sort_keys=True)
+
+    def to_prometheus(self) -> str:
+        snap = self.snapshot()
+        labels = _label_str(snap["labels"])
+        lines = []
+        for name in sorted(snap["counters"]):
+            metric = f"{PREFIX}_{name}_total"
+            lines.append(f"# HELP {metric} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{labels} {snap['counters'][name]}")
+
+        if snap["stages"]:
+            lines.append(f"# HELP {PREFIX}_stage_seconds_total timp de perete per etapa")
+            lines.append(f"# TYPE {PREFIX}_stage_seconds_total counter")
+            for name in sorted(snap["stages"]):
+                st_labels = _label_str({**snap["labels"], "stage": name})
+                lines.append(f"{PREFIX}_stage_seconds_total{st_labels} {snap['stages'][name]['seconds']:.6f}")
+
+        for name in sorted(snap["histograms"]):
+            h = snap["histograms"][name]
+            metric = f"{PREFIX}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for upper, n in h["buckets"]:
+                cumulative += n
+                lines.append(f"{metric}_bucket{_label_str({**snap['labels'], 'le': upper})} {cumulative}")
+            lines.append(f"{metric}_sum{labels} {h['sum']:.6f}")
+            lines.append(f"{metric}_count{labels} {h['count']}")
+
+        lines.append(f"# TYPE {PREFIX}_elapsed_seconds gauge")
+        lines.append(f"{PREFIX}_elapsed_seconds{labels} {snap['elapsed_s']:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str, fmt: str = "prom"):
+        """
+        prom: rescrie fisierul atomic (merge cu textfile collector-ul din node_exporter);
+        jsonl: adauga o linie, deci scrierile periodice formeaza o serie de timp.
+        """
+        if fmt == "jsonl":
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(self.to_json_line() + "\n")
+            return
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+    @contextmanager
+    def stream(self, path: str | None, fmt: str = "prom", interval: float = 0.0):
+        """
+        Scrie metricile in `path` la fiecare `interval` secunde cat timp
+        ruleaza blocul (interval <= 0: doar la final). Scrierea finala are loc
+        si daca blocul arunca, ca o rulare esuata sa lase metricile pe disc.
+        """
+        if not path:
+            yield self
+            return
+        stop = threading.Event()
+
+        def loop():
+            while not stop.wait(interval):
+                self.write(path, fmt)
+
+        thread = threading.Thread(target=loop, daemon=True) if interval > 0 else None
+        if thread is not None:
+            thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            if thread is not None:
+                thread.join()
+            self.write(path, fmt)
+
+def summary(snapshot: dict) -> str:
+    """O linie cu timpul per etapa si p50/p99 pe batch, pentru raportul din consola."""
+    stages = ", ".join(f"{k} {st['seconds']:.1f} s" for k, st in snapshot["stages"].items())
+    text = f"Etape: {stages or '-'}"
+    if "batch_latency" in snapshot["histograms"]:
+        h = Histogram()
+        h.merge(snapshot["histograms"]["batch_latency"])
+        text += f"; latenta batch p50 <= {h.quantile(0.5):g} s, p99 <= {h.quantile(0.99):g} s"
+    return text
+
+
+def _le(upper: float) -> str:
+    return "+Inf" if upper == float("inf") else repr(upper)
+
+
+def _label_str(labels: dict) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+    return "{" + inner + "}"
@@ -0,0 +1,207 @@
+"""
+Clasament local de popularitate / calitate, pentru utilizatorii fara
+profil: "populare in genul X" instant, fara retea.
+
+    ranker = PopularityRanker.from_catalog()
+    ranker.top(10)                     # [(item_id, scor), ...] in tot catalogul
+    ranker.top(10, genre="Fantasy")    # doar in gen
+    popular(ranker, 10, genre="Fantasy")   # raspuns ca RecommendItemsToUser
+
+Scorul unei carti combina, prin rangul percentil al fiecarei componente
+(ca ponderile din WEIGHTS sa insemne ce spun, indiferent de scara):
+- rating: media bayesiana din ratingsByStars, (v * R + m * C) / (v + m),
+  cu C = media tuturor rating-urilor si m = PRIOR_VOTES_QUANTILE din
+  numarul de voturi (o carte cu 3 note de 5 nu bate una cu 2 milioane de 4.3);
+- bbe: log(bbeScore), scorul din lista Best Books Ever (bbeVotes intra
+  deja in el: suma punctelor de la fiecare votant);
+- volum: log(numRatings).
+
+Clasamentul global si primele TOP_N carti din fiecare gen sunt array-uri
+precalculate (CSR pe genuri), deci o lista e o felie.
+"""
+import numpy as np
+
+from background import BackgroundSingleton
+
+WEIGHTS = {"rating": 0.5, "bbe": 0.3, "volume": 0.2}
+PRIOR_VOTES_QUANTILE = 0.5
+TOP_N = 200  # carti pastrate per gen
+MIN_GENRE_BOOKS = 20  # genurile mai mici nu apar in genres()
+
+
+def bayesian_average(stars: np.ndarray, prior_votes: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    stars: n x 5, numarul de voturi cu 5, 4, 3, 2, 1 stele (NaN = necunoscut).
+    Intoarce (media bayesiana, numarul de voturi); fara voturi -> media globala.
+    """
+    stars = np.nan_to_num(np.asarray(stars, dtype=np.float64))
+    points = np.array([5, 4, 3, 2, 1], dtype=np.float64)
+    votes = stars.sum(axis=1)
+    total = stars @ points
+    prior_mean = total.sum() / max(votes.sum(), 1)
+    if prior_votes is None:
+        rated = votes[votes > 0]
+        prior_votes = float(np.quantile(rated, PRIOR_VOTES_QUANTILE)) if len(rated) else 1.0
+    return (total + prior_votes * prior_mean) / (votes + prior_votes), votes
+
+
+def _percentile_rank(values: np.ndarray) -> np.ndarray:
+    """Rangul in [0, 1]; valorile egale primesc acelasi rang."""
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    below = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return (below[inverse] + (counts[inverse] - 1) / 2) / max(len(values) - 1, 1)
+
+
+class PopularityRanker:
+    def __init__(self, item_ids: list, scores: np.ndarray, genres=None, top_n: int = TOP_N):
+        """
+        scores: scorul fiecarei carti (mai mare = mai sus);
+        genres: catalog.ListColumn cu aceleasi randuri (optional).
+        """
+        self.item_ids = list(item_ids)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.order = np.argsort(-self.scores, kind="stable").astype(np.int32)
+
+        # genul g: self._genre_items[self._genre_indptr[g]:self._genre_indptr[g + 1]], deja ordonate
+        self.genre_names = list(genres.vocab) if genres is not None else []
+        self._genre_ids = {g: i for i, g in enumerate(self.genre_names)}
+        self.genre_sizes = np.zeros(len(self.genre_names), dtype=np.int64)
+        indptr = [0]
+        items = []
+        if genres is not None:
+            rows = genres.row_of_each_value()
+            self.genre_sizes = np.bincount(genres.indices, minlength=len(self.genre_names))
+            # toate perechile (gen, carte) sortate dupa gen, apoi dupa scor
+            pair_order = np.lexsort((-self.scores[rows], genres.indices))
+            by_genre = genres.indices[pair_order]
+            bounds = np.searchsorted(by_genre, np.arange(len(self.genre_names) + 1))
+            for g in range(len(self.genre_names)):
+                top = rows[pair_order[bounds[g]:min(bounds[g + 1], bounds[g] + top_n)]]
+                items.append(top)
+                indptr.append(indptr[-1] + len(top))
+        self._genre_indptr = np.array(indptr, dtype=np.int64)
+        self._genre_items = np.concatenate(items).astype(np.int32) if items else np.zeros(0, dtype=np.int32)
+        self.frame = None
+        self.csv_path = None
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def genres(self, min_books: int = MIN_GENRE_BOOKS) -> list:
+        """Genurile cu cel putin `min_books` carti, de la cel mai mare."""
+        big = np.flatnonzero(self.genre_sizes >= min_books)
+        return [self.genre_names[g] for g in big[np.argsort(-self.genre_sizes[big], kind="stable")]]
+
+    def top(self, count: int = 10, genre: str | None = None, exclude=()) -> list:
+        """[(item_id, scor)]: cele mai bune `count` carti, in tot catalogul sau doar in `genre`."""
+        if genre:
+            g = self._genre_ids.get(genre)
+            if g is None:
+                return []
+            rows = self._genre_items[self._genre_indptr[g]:self._genre_indptr[g + 1]]
+        else:
+            rows = self.order
+        out = []
+        exclude = set(exclude)
+        for row in rows.tolist():
+            item_id = self.item_ids[row]
+            if item_id not in exclude:
+                out.append((item_id, float(self.scores[row])))
+                if len(out) == count:
+                    break
+        return out
+
+    @classmethod
+    def from_frame(cls, df, genres=None, top_n: int = TOP_N) -> "PopularityRanker":
+        """Din frame-ul pregatit de catalog (bookId duplicat: pastram prima aparitie)."""
+        import catalog
+
+        keep = np.flatnonzero(~df["bookId"].duplicated().to_numpy())
+        frame = df.iloc[keep]
+        stars = frame[catalog.STAR_COLUMNS].to_numpy(dtype="float64", na_value=np.nan)
+        rating, votes = bayesian_average(stars)
+        # fara ratingsByStars: rating-ul afisat, cu aceeasi atractie spre medie
+        missing = np.isnan(stars).any(axis=1)
+        if missing.any():
+            num = frame["numRatings"].to_numpy(dtype="float64", na_value=0)[missing]
+            avg = frame["rating"].to_numpy(dtype="float64", na_value=0)[missing]
+            prior_mean = float(np.average(rating[~missing], weights=votes[~missing] + 1)) if (~missing).any() else 3.0
+            prior_votes = float(np.quantile(votes[votes > 0], PRIOR_VOTES_QUANTILE)) if (votes > 0).any() else 1.0
+            rating[missing] = (avg * num + prior_votes * prior_mean) / (num + prior_votes)
+            votes[missing] = num
+
+        bbe = np.log1p(np.clip(frame["bbeScore"].to_numpy(dtype="float64", na_value=0), 0, None))
+        scores = (WEIGHTS["rating"] * _percentile_rank(rating)
+                  + WEIGHTS["bbe"] * _percentile_rank(bbe)
+                  + WEIGHTS["volume"] * _percentile_rank(np.log1p(votes)))
+        if genres is not None:
+            genres = genres.take(keep)
+        ranker = cls(frame["bookId"].astype(str).tolist(), scores, genres, top_n)
+        ranker.bayes_rating = rating.astype(np.float32)
+        ranker.frame = frame
+        return ranker
+
+    @classmethod
+    def from_catalog(cls, path: str | None = None) -> "PopularityRanker":
+        import catalog
+
+        path = path or catalog.CSV_PATH
+        ranker = cls.from_frame(catalog.load_catalog(path), catalog.load_lists(path)["genres"])
+        ranker.csv_path = path
+        catalog.shared_props(path)
+        return ranker
+
+
+def popular(ranker: PopularityRanker, count: int = 10, genre: str | None = None, exclude=()) -> dict:
+    """Raspuns in forma RecommendItemsToUser ({"recomms": [{"id", "values"}]})."""
+    import catalog
+
+    return catalog.as_recomms([item_id for item_id, _ in ranker.top(count, genre, exclude)], ranker.csv_path)
+
+
+def popular_for_genres(ranker: PopularityRanker, genres: list, count: int = 10, exclude=()) -> dict:
+    """
+    Populare in mai multe genuri (ex. fav_genres), intercalate: prima din
+    fiecare gen, apoi a doua etc. Fara genuri cunoscute: clasamentul global.
+    """
+    lists = [ranker.top(count, g, exclude) for g in genres]
+    lists = [hits for hits in lists if hits]
+    if not lists:
+        return popular(ranker, count, exclude=exclude)
+    picked = {}
+    for rank in range(count):
+        for hits in lists:
+            if rank < len(hits):
+                picked.setdefault(*hits[rank])
+        if len(picked) >= count:
+            break
+    import catalog
+
+    return catalog.as_recomms(list(picked)[:count], ranker.csv_path)
+
+
+# ---------- clasamentul procesului ----------
+
+_shared = BackgroundSingleton(PopularityRanker.from_catalog, "popularity")
+
+
+def shared_ranker(wait: bool = True) -> PopularityRanker | None:
+    """Clasamentul procesului (sub o secunda); None -> aplicatiile nu arata liste populare."""
+    return _shared.get(wait)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Cele mai bune carti, global sau dintr-un gen.")
+    parser.add_argument("--genre", default=None)
+    parser.add_argument("--count", type=int, default=10)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    ranker = PopularityRanker.from_catalog()
+    print(f"Clasament: {len(ranker)} carti, {len(ranker.genres())} genuri, {time.perf_counter() - t0:.2f} s\n")
+    titles = dict(zip(ranker.frame["bookId"].astype(str), ranker.frame["title"]))
+    for item_id, score in ranker.top(args.count, args.genre):
+        print(f"{score:.3f}  {titles[item_id]}")
@@ -0,0 +1,158 @@
+"""
+Fabrica comuna de clienti Recombee pentru load_books, init_properties,
+app si streamlit_app.
+
+make_client() intoarce un singur client per proces, cu o sesiune HTTP
+persistenta: conexiunile (si handshake-ul TLS) se refolosesc intre cereri,
+in loc de un requests.put/post nou, fara pool, la fiecare apel.
+
+    RECOMBEE_POOL_SIZE=10   conexiuni pastrate deschise (implicit 10)
+    RECOMBEE_HTTP2=1        HTTP/2 prin httpx (pip install "httpx[http2]")
+
+Cu RECOMBEE_LOCAL=1 intoarce stand-in-ul in-process din local_recombee
+(fara retea, latenta / erori configurabile), partajat in tot procesul ca
+starea lui sa supravietuiasca intre apeluri (ex. rerun-uri Streamlit).
+"""
+import atexit
+import json
+import os
+import sys
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from recombee_api_client.api_client import RecombeeClient, Region
+from recombee_api_client.exceptions import ApiTimeoutException, ResponseException
+
+from catalog import env_int
+
+DEFAULT_POOL_SIZE = 10
+
+_local = None
+_local_lock = threading.Lock()
+_shared = None  # (pid, setari, client): dupa fork, procesul copil isi face propriul client
+_shared_lock = threading.Lock()
+
+
+def is_local() -> bool:
+    return os.environ.get("RECOMBEE_LOCAL", "").strip() == "1"
+
+
+class PooledRecombeeClient(RecombeeClient):
+    """
+    RecombeeClient care trimite prin aceeasi sesiune HTTP (keep-alive, pool
+    de `pool_size` conexiuni). Semnarea URL-urilor, erorile si batch-urile
+    multipart raman cele din clientul oficial; inlocuim doar transportul.
+    """
+
+    def __init__(self, database_id: str, token: str, pool_size: int = DEFAULT_POOL_SIZE,
+                 http2: bool = False, **kwargs):
+        super().__init__(database_id, token, **kwargs)
+        self.pool_size = pool_size
+        self.http2 = http2
+        if http2:
+            try:
+                import httpx
+            except ImportError:
+                raise RuntimeError('RECOMBEE_HTTP2=1 necesita httpx: pip install "httpx[http2]"') from None
+            self._httpx = httpx
+            limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            self.session = httpx.Client(http2=True, limits=limits)
+        else:
+            self._httpx = None
+            self.session = requests.Session()
+            # fara retry-uri la nivel de transport: le facem noi (load_books / send_with_retry)
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+
+    def _send_http(self, method: str, request, uri: str, timeout: float, body: bool = True):
+        headers = self._RecombeeClient__get_http_headers({"Content-Type": "application/json"} if body else None)
+        data = json.dumps(self._RecombeeClient__get_body_parameters(request)) if body else None
+        if self._httpx is None:
+            response = self.session.request(method, uri, data=data, headers=headers, timeout=timeout)
+        else:
+            try:
+                response = self.session.request(method, uri, content=data, headers=headers, timeout=timeout)
+            except self._httpx.TimeoutException:
+                raise ApiTimeoutException(request) from None
+        self._RecombeeClient__check_errors(response, request)
+        return response.json()
+
+    # metodele private din RecombeeClient (name mangling: self.__put -> _RecombeeClient__put)
+    def _RecombeeClient__put(self, request, uri: str, timeout):
+        return self._send_http("PUT", request, uri, timeout)
+
+    def _RecombeeClient__get(self, request, uri: str, timeout):
+        return self._send_http("GET", request, uri, timeout, body=False)
+
+    def _RecombeeClient__post(self, request, uri: str, timeout):
+        return self._send_http("POST", request, uri, timeout)
+
+    def _RecombeeClient__delete(self, request, uri: str, timeout):
+        return self._send_http("DELETE", request, uri, timeout)
+
+    def close(self):
+        self.session.close()
+
+
+def is_transient(e: Exception) -> bool:
+    """
+    Erorile dupa care merita reincercat: timeout, 5xx / 429 si erorile de
+    transport (conexiune refuzata / resetata, DNS), atat din requests (sunt
+    OSError) cat si din httpx (TransportError, cu RECOMBEE_HTTP2=1).
+    """
+    if isinstance(e, ApiTimeoutException):
+        return True
+    if isinstance(e, ResponseException):
+        return e.status_code >= 500 or e.status_code == 429
+    if isinstance(e, OSError):
+        return True
+    httpx = sys.modules.get("httpx")  # importat doar daca RECOMBEE_HTTP2=1
+    return httpx is not None and isinstance(e, httpx.TransportError)
+
+
+def client_settings() -> tuple:
+    """Setarile din env de care depinde clientul real (local, baza, token, regiune, HTTP/2)."""
+    return (
+        is_local(),
+        os.environ.get("RECOMBEE_DB_ID", "").strip(),
+        os.environ.get("RECOMBEE_API_TOKEN", "").strip(),
+        os.environ.get("RECOMBEE_REGION", "EU_WEST").strip() or "EU_WEST",
+        os.environ.get("RECOMBEE_HTTP2", "").strip() == "1",
+    )
+
+
+def make_client(pool_size: int | None = None):
+    """
+    Clientul partajat al procesului. `pool_size` (ex. --workers din load_books)
+    conteaza doar la primul apel; implicit RECOMBEE_POOL_SIZE. Daca setarile
+    din env s-au schimbat (ex. .env recitit de Streamlit), facem un client nou.
+    """
+    if is_local():
+        global _local
+        with _local_lock:
+            if _local is None:
+                import local_recombee
+
+                _local = local_recombee.from_env()
+        return _local
+
+    global _shared
+    settings = client_settings()
+    with _shared_lock:
+        if _shared is None or _shared[:2] != (os.getpid(), settings):
+            _, db_id, token, region, http2 = settings
+            for name, value in (("RECOMBEE_DB_ID", db_id), ("RECOMBEE_API_TOKEN", token)):
+                if not value:
+                    raise KeyError(name)
+            client = PooledRecombeeClient(
+                db_id,
+                token,
+                pool_size=max(pool_size or 0, env_int("RECOMBEE_POOL_SIZE", DEFAULT_POOL_SIZE)),
+                http2=http2,
+                region=Region[region],
+            )
+            atexit.register(client.close)
+            _shared = (os.getpid(), settings, client)
+        return _shared[2]
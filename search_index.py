@@ -0,0 +1,297 @@
+"""
+Index local de cautare (title / author / series) peste catalog, ca
+accelerator pentru SearchItems: fara retea, raspuns in sub o milisecunda.
+
+    index = SearchIndex.from_catalog()
+    index.search("hunger games", 5)     # [(item_id, scor), ...]
+    search(index, "hungr gam", 5, mode="fallback", remote=...)  # raspuns ca SearchItems
+
+- tokenizare pe litere / cifre, dupa fold(): lowercase + fara diacritice
+  ("ă" -> "a", "ø" -> "o"), deci "pedeapsa" gaseste "Pedeapsă";
+- ultimul cuvant din query e tratat ca prefix (se tasteaza inca);
+- cuvintele care nu exista in vocabular sunt inlocuite cu cele mai
+  apropiate dupa trigrame (greseli de tastare);
+- scorul e BM25F: tf-ul fiecarui camp ponderat (titlul conteaza cel mai
+  mult), plus un mic bonus de popularitate la egalitate.
+
+Pentru fiecare postare scorul BM25 e precalculat la constructie, asa ca
+o cautare e doar cateva adunari pe array-uri numpy.
+"""
+import math
+import os
+import re
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+
+from background import BackgroundSingleton
+from catalog import ROLE_RE
+
+FIELD_WEIGHTS = {"title": 3.0, "author": 2.0, "series": 1.5}
+K1 = 1.2
+B = 0.75
+PREFIX_WEIGHT = 0.8  # potrivire doar pe prefix (nu cuvant intreg)
+FUZZY_WEIGHT = 0.6  # potrivire prin trigrame
+MAX_PREFIX_TERMS = 64
+MAX_FUZZY_TERMS = 3
+MIN_TRIGRAM_SIMILARITY = 0.35
+POPULARITY_WEIGHT = 2.0
+STOPWORD_IDF = 1.5  # cuvinte in ~20%+ din carti ("the", "of"): ignorate daca query-ul are si altele
+
+# litere fara descompunere NFKD
+_FOLD_EXTRA = str.maketrans({"ø": "o", "đ": "d", "ħ": "h", "ı": "i", "ł": "l", "ß": "ss", "æ": "ae", "œ": "oe", "þ": "th"})
+# semnele diacritice combinante (dupa NFKD); restul caracterelor non-ASCII
+# oricum nu intra in tokeni
+_COMBINING_RE = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def fold(text) -> str:
+    """Lowercase, fara diacritice."""
+    text = str(text or "")
+    if text.isascii():
+        return text.lower()  # cazul obisnuit: nimic de descompus
+    text = unicodedata.normalize("NFKD", text.lower()).translate(_FOLD_EXTRA)
+    return _COMBINING_RE.sub("", text)
+
+
+def tokenize(text) -> list:
+    return _TOKEN_RE.findall(fold(text))
+
+
+def trigrams(term: str) -> set:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _idf(n: int, df: int) -> float:
+    return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+
+class SearchIndex:
+    def __init__(self, item_ids: list, fields: dict, popularity=None):
+        """
+        item_ids: id-urile cartilor; fields: {camp: lista de texte} (aceeasi ordine);
+        popularity: numRatings (sau orice scor >= 0), folosit doar la departajare.
+        """
+        self.item_ids = list(item_ids)
+        self.csv_path = None  # catalogul valorilor din raspunsuri (None = catalog.CSV_PATH)
+        n = len(self.item_ids)
+
+        # tf ponderat pe campuri, per (termen, document)
+        tf = {}
+        doc_len = np.zeros(n, dtype=np.float32)
+        for field, texts in fields.items():
+            weight = FIELD_WEIGHTS.get(field, 1.0)
+            for doc, text in enumerate(texts):
+                if field == "author":
+                    text = ROLE_RE.sub(" ", str(text or ""))
+                tokens = tokenize(text)
+                doc_len[doc] += weight * len(tokens)
+                for term in tokens:
+                    postings = tf.setdefault(term, {})
+                    postings[doc] = postings.get(doc, 0.0) + weight
+
+        avg_len = float(doc_len.mean()) if n else 1.0
+        norm = K1 * (1 - B + B * doc_len / max(avg_len, 1e-9))
+
+        self.terms = sorted(tf)  # sortat: prefixele sunt intervale contigue
+        self._term_ids = {t: i for i, t in enumerate(self.terms)}
+        self._docs = []
+        self._scores = []
+        self._idf = np.zeros(len(self.terms), dtype=np.float32)
+        for term_id, term in enumerate(self.terms):
+            postings = tf[term]
+            docs = np.fromiter(postings.keys(), dtype=np.int32, count=len(postings))
+            freqs = np.fromiter(postings.values(), dtype=np.float32, count=len(postings))
+            idf = self._idf[term_id] = _idf(n, len(docs))
+            self._docs.append(docs)
+            self._scores.append((idf * freqs * (K1 + 1) / (freqs + norm[docs])).astype(np.float32))
+        self._df = np.array([len(d) for d in self._docs], dtype=np.int32)
+
+        # trigrama -> id-urile termenilor care o contin (pentru greseli de tastare)
+        grams = {}
+        for term_id, term in enumerate(self.terms):
+            for g in trigrams(term):
+                grams.setdefault(g, []).append(term_id)
+        self._grams = {g: np.array(ids, dtype=np.int32) for g, ids in grams.items()}
+        self._gram_counts = np.array([len(trigrams(t)) for t in self.terms], dtype=np.int16)
+
+        pop = np.zeros(n, dtype=np.float32) if popularity is None else np.nan_to_num(
+            np.asarray(popularity, dtype=np.float32))
+        pop = np.log1p(np.maximum(pop, 0))
+        self._prior = (POPULARITY_WEIGHT * pop / pop.max()).astype(np.float32) if pop.max() > 0 else pop
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    @classmethod
+    def from_frame(cls, df) -> "SearchIndex":
+        """Din frame-ul pregatit de catalog (bookId duplicat: pastram prima aparitie)."""
+        df = df.drop_duplicates("bookId")
+        fields = {f: df[f].astype(object).where(df[f].notna(), "").tolist() for f in FIELD_WEIGHTS if f in df}
+        index = cls(df["bookId"].astype(str).tolist(), fields, df["numRatings"].to_numpy(dtype="float64", na_value=0))
+        index.frame = df
+        return index
+
+    @classmethod
+    def from_catalog(cls, path: str | None = None) -> "SearchIndex":
+        import catalog
+
+        path = path or catalog.CSV_PATH
+        index = cls.from_frame(catalog.load_catalog(path))
+        index.csv_path = path
+        catalog.shared_props(path)  # valorile rezultatelor, convertite inainte de prima cautare
+        return index
+
+    # ---------- expandarea termenilor din query ----------
+
+    def prefix_terms(self, prefix: str) -> tuple[list, float]:
+        """
+        Id-urile termenilor care incep cu `prefix` (cei mai frecventi primii)
+        si idf-ul prefixului, calculat ca pentru un singur termen cu df-ul lor cumulat.
+        """
+        lo = bisect_left(self.terms, prefix)
+        hi = bisect_left(self.terms, prefix + "\uffff")
+        ids = np.arange(lo, hi, dtype=np.int32)
+        idf = _idf(len(self.item_ids), min(len(self.item_ids), int(self._df[ids].sum())))
+        if len(ids) > MAX_PREFIX_TERMS:
+            ids = ids[np.argsort(-self._df[ids], kind="stable")[:MAX_PREFIX_TERMS]]
+        return ids.tolist(), idf
+
+    def fuzzy_terms(self, term: str, limit: int = MAX_FUZZY_TERMS) -> list:
+        """Termenii cei mai apropiati dupa similaritatea Jaccard pe trigrame."""
+        grams = trigrams(term)
+        hits = [self._grams[g] for g in grams if g in self._grams]
+        if not hits:
+            return []
+        ids, common = np.unique(np.concatenate(hits), return_counts=True)
+        sim = common / (len(grams) + self._gram_counts[ids] - common)
+        keep = sim >= MIN_TRIGRAM_SIMILARITY
+        ids, sim = ids[keep], sim[keep]
+        order = np.argsort(-sim, kind="stable")[:limit]
+        return [(int(ids[i]), float(sim[i])) for i in order]
+
+    def _expand(self, token: str, is_last: bool) -> list:
+        """[(term_id, pondere)] pentru un cuvant din query."""
+        term_id = self._term_ids.get(token)
+        expanded = {} if term_id is None else {term_id: 1.0}
+        if is_last:
+            # completarile au toate idf-ul prefixului: altfel una rara ("thera")
+            # ar bate cuvantul frecvent cautat de fapt ("the" / "theory")
+            ids, prefix_idf = self.prefix_terms(token)
+            for tid in ids:
+                expanded.setdefault(tid, PREFIX_WEIGHT * prefix_idf / max(float(self._idf[tid]), 1e-6))
+        if not expanded and len(token) >= 3:
+            for tid, sim in self.fuzzy_terms(token):
+                expanded[tid] = FUZZY_WEIGHT * sim
+        return list(expanded.items())
+
+    def _is_stopword(self, expanded: list) -> bool:
+        return len(expanded) == 1 and self._idf[expanded[0][0]] < STOPWORD_IDF
+
+    # ---------- cautare ----------
+
+    def search(self, query: str, k: int = 10) -> list:
+        """[(item_id, scor)] ordonate descrescator; [] daca nimic nu se potriveste."""
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        expansions = [self._expand(token, is_last=pos == len(tokens) - 1) for pos, token in enumerate(tokens)]
+        expansions = [e for e in expansions if e]
+        if not expansions:
+            return []
+        informative = [e for e in expansions if not self._is_stopword(e)]
+        if informative:
+            expansions = informative  # listele lungi de postari ale lui "the" costa, dar nu schimba ordinea
+
+        total = np.zeros(len(self.item_ids), dtype=np.float32)
+        best = np.empty_like(total)
+        for expanded in expansions:
+            if len(expanded) == 1:
+                (t, w), = expanded
+                total[self._docs[t]] += w * self._scores[t]
+                continue
+            # un cuvant din query conteaza o singura data per document (maximul expandarilor)
+            best.fill(0)
+            for t, w in expanded:
+                docs = self._docs[t]
+                best[docs] = np.maximum(best[docs], w * self._scores[t])
+            total += best
+
+        candidates = np.flatnonzero(total)
+        scores = total[candidates] + self._prior[candidates]
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.item_ids[candidates[i]], float(scores[i])) for i in top]
+
+
+
+def _as_response(index: SearchIndex, hits: list) -> dict:
+    import catalog
+
+    return catalog.as_recomms([item_id for item_id, _ in hits], index.csv_path)
+
+
+MODES = ("local", "remote", "fallback", "merge")
+
+
+def mode_from_env() -> str:
+    """SEARCH_MODE din mediu (implicit fallback: local, iar SearchItems doar fara rezultate)."""
+    mode = os.environ.get("SEARCH_MODE", "").strip().lower() or "fallback"
+    return mode if mode in MODES else "fallback"
+
+
+def search(index: SearchIndex | None, query: str, count: int = 10, mode: str = "fallback", remote=None) -> dict:
+    """
+    Raspuns in forma SearchItems ({"recomms": [{"id", "values"}]}).
+
+    mode:
+      local    - doar indexul local;
+      remote   - doar remote(query, count) (SearchItems);
+      fallback - local; remote doar daca local nu gaseste nimic;
+      merge    - ambele, combinate prin reciprocal rank fusion (remote aduce
+                 personalizarea, local aduce toleranta la greseli).
+    """
+    if index is None or mode == "remote":
+        return remote(query, count)
+
+    hits = index.search(query, count)
+    if mode == "local" or (mode == "fallback" and hits) or remote is None:
+        return _as_response(index, hits)
+    if mode == "fallback":
+        return remote(query, count)
+
+    remote_recomms = (remote(query, count) or {}).get("recomms", [])
+    fused = {}
+    for rank, item_id in enumerate(item_id for item_id, _ in hits):
+        fused[item_id] = fused.get(item_id, 0.0) + 1 / (60 + rank)
+    for rank, rec in enumerate(remote_recomms):
+        fused[rec["id"]] = fused.get(rec["id"], 0.0) + 1 / (60 + rank)
+    ranked = sorted(fused, key=fused.get, reverse=True)[:count]
+
+    import catalog
+
+    by_id = {rec["id"]: rec for rec in remote_recomms}
+    local_values = catalog.props_for([i for i in ranked if i not in by_id], index.csv_path)
+    return {"recomms": [by_id.get(i) or {"id": i, "values": local_values.get(i, {})} for i in ranked]}
+
+
+# ---------- indexul procesului ----------
+
+_shared = BackgroundSingleton(SearchIndex.from_catalog, "search-index")
+
+
+def shared_index(wait: bool = True) -> SearchIndex | None:
+    """
+    Indexul construit o data per proces (cateva secunde, din cache-ul catalogului).
+    Cu wait=False constructia porneste in fundal si primim None pana e gata;
+    search(None, ...) merge atunci direct pe remote. None si daca nu exista
+    catalog local (vezi `_shared.error`): ramanem pe SearchItems.
+    """
+    return _shared.get(wait)
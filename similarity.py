@@ -0,0 +1,412 @@
+"""
+Similaritate item-to-item din continutul catalogului, fara retea: calea
+locala pentru tab-ul "Similare" si fallback cand RecommendItemsToItem
+nu raspunde.
+
+    table = SimilarityTable.from_catalog()   # din cache daca exista
+    table.similar("2767052-the-hunger-games", 10)   # [(item_id, scor), ...]
+    recommend(table, item_id, 10, mode="fallback", remote=...)  # raspuns ca RecommendItemsToItem
+
+Scorul dintre doua carti e o suma ponderata (WEIGHTS) de:
+- cosinus TF-IDF pe `description` (cele mai informative DESC_TERMS
+  cuvinte per carte; cuvintele din peste MAX_DF_FRAC din carti ignorate);
+- cosinus pe genuri, ponderate cu idf (genurile rare spun mai mult);
+- acelasi autor (primul din lista) / aceeasi serie;
+- epoca publicarii: exp(-|ani| / ERA_SCALE_YEARS), doar ca departajare
+  intre primii candidati.
+
+Vecinii (top TOP_K) se precalculeaza pentru toate cartile, pe blocuri de
+randuri, si se pastreaza in doua array-uri n x TOP_K (id-uri si scoruri),
+salvate langa cache-ul catalogului; o cautare e o simpla felie.
+"""
+import json
+import math
+import os
+import re
+import time
+from collections import Counter
+
+import numpy as np
+
+from background import BackgroundSingleton
+from catalog import ROLE_RE
+from search_index import fold, tokenize
+
+WEIGHTS = {"description": 0.45, "genres": 0.30, "author": 0.10, "series": 0.10, "era": 0.05}
+TOP_K = 50
+DESC_TERMS = 64  # termeni pastrati per descriere
+MIN_TERM_LEN = 3
+MAX_DF_FRAC = 0.1
+COMMON_GENRE_DF = 2000  # genurile mai frecvente merg prin produs dens, restul prin postari
+ERA_SCALE_YEARS = 15.0
+SHORTLIST = 3  # candidati = SHORTLIST * TOP_K, reordonati cu epoca
+BLOCK_ROWS = 256
+SIM_VERSION = 1
+
+_SERIES_NUMBER_RE = re.compile(r"\s*#.*$")
+
+
+def primary_author(author) -> str:
+    if not isinstance(author, str):  # NaN
+        return ""
+    return fold(ROLE_RE.sub("", author).split(",")[0]).strip()
+
+
+def series_name(series) -> str:
+    # "The Hunger Games #1" -> "the hunger games"
+    if not isinstance(series, str):
+        return ""
+    return fold(_SERIES_NUMBER_RE.sub("", series)).strip()
+
+
+def content_scores(frame, i: int, rows: np.ndarray, description: np.ndarray) -> np.ndarray:
+    """
+    Acelasi scor ca in tabela, pentru cativa candidati (ex. de la ann_index):
+    `description` e similaritatea descrierilor deja calculata de apelant;
+    genurile se compara prin cosinusul seturilor (fara ponderi idf).
+    """
+    genres = frame["genres"].iloc
+    authors = frame["author"].iloc
+    series = frame["series"].iloc
+    years = frame["publish_year"].to_numpy(dtype="float64", na_value=np.nan)
+
+    mine = set(genres[i] or [])
+    author, serie = primary_author(authors[i]), series_name(series[i])
+    out = WEIGHTS["description"] * np.asarray(description, dtype=np.float64)
+    for n, r in enumerate(rows.tolist()):
+        other = set(genres[r] or [])
+        if mine and other:
+            out[n] += WEIGHTS["genres"] * len(mine & other) / math.sqrt(len(mine) * len(other))
+        if author and primary_author(authors[r]) == author:
+            out[n] += WEIGHTS["author"]
+        if serie and series_name(series[r]) == serie:
+            out[n] += WEIGHTS["series"]
+    dy = np.abs(years[rows] - years[i])
+    out += WEIGHTS["era"] * np.where(np.isnan(dy), 0, np.exp(-dy / ERA_SCALE_YEARS)) * (out > 0)
+    return out
+
+
+class _Postings:
+    """Matrice rara in forma CSR (randuri -> (coloana, pondere)) plus transpusa ei."""
+
+    def __init__(self, n_rows: int, n_cols: int, rows: np.ndarray, cols: np.ndarray, weights: np.ndarray):
+        order = np.lexsort((cols, rows))
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=n_rows)))).astype(np.int64)
+        self.cols = cols[order].astype(np.int32)
+        self.weights = weights[order].astype(np.float32)
+        order = np.argsort(cols, kind="stable")
+        self.t_indptr = np.concatenate(([0], np.cumsum(np.bincount(cols, minlength=n_cols)))).astype(np.int64)
+        self.t_rows = rows[order].astype(np.int32)
+        self.t_weights = weights[order].astype(np.float32)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return len(self.indptr) - 1, len(self.t_indptr) - 1
+
+    def dot(self, m: np.ndarray) -> np.ndarray:
+        """X @ m, cu m dens (coloane x d)."""
+        return _sparse_dot(self.indptr, self.cols, self.weights, m)
+
+    def t_dot(self, m: np.ndarray) -> np.ndarray:
+        """X.T @ m, cu m dens (randuri x d)."""
+        return _sparse_dot(self.t_indptr, self.t_rows, self.t_weights, m)
+
+    def add_block(self, out: np.ndarray, lo: int, hi: int, weight: float, unique: bool = False):
+        """
+        out[r - lo, :] += weight * (randul r . fiecare rand), pentru r in [lo, hi).
+        unique=True: fiecare rand are cel mult o coloana (autor, serie), deci
+        perechile nu se repeta si putem aduna direct, fara bincount.
+        """
+        n = out.shape[1]
+        a, b = self.indptr[lo], self.indptr[hi]
+        cols = self.cols[a:b]
+        local = np.repeat(np.arange(hi - lo), np.diff(self.indptr[lo:hi + 1]))
+        lengths = self.t_indptr[cols + 1] - self.t_indptr[cols]
+        total = int(lengths.sum())
+        # pozitiile din postari ale fiecarei perechi, fara bucla Python
+        offsets = np.repeat(self.t_indptr[cols] - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+        values = np.repeat(self.weights[a:b] * weight, lengths) * self.t_weights[offsets]
+        if unique:
+            out[np.repeat(local, lengths), self.t_rows[offsets]] += values
+        else:
+            keys = np.repeat(local.astype(np.int64) * n, lengths) + self.t_rows[offsets]
+            out += np.bincount(keys, values, minlength=(hi - lo) * n).reshape(hi - lo, n)
+
+
+def _sparse_dot(indptr: np.ndarray, idx: np.ndarray, values: np.ndarray, m: np.ndarray,
+                chunk: int = 200_000) -> np.ndarray:
+    # pe bucati de `chunk` valori nenule, ca m[idx] sa nu ocupe nnz x d in memorie
+    out = np.zeros((len(indptr) - 1, m.shape[1]), dtype=np.float32)
+    owner = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    for a in range(0, len(idx), chunk):
+        b = min(a + chunk, len(idx))
+        rows = owner[a:b]
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        out[rows[starts]] += np.add.reduceat(m[idx[a:b]] * values[a:b, None], starts, axis=0)
+    return out
+
+
+def description_postings(descriptions: list) -> _Postings:
+    """TF-IDF pe descrieri (tf sublinear), randuri normalizate; folosit si de ann_index."""
+    n = len(descriptions)
+    counts = [Counter(t for t in tokenize(d) if len(t) >= MIN_TERM_LEN and not t.isdigit()) for d in descriptions]
+    df = Counter()
+    for c in counts:
+        df.update(c.keys())
+    max_df = MAX_DF_FRAC * n
+    vocab = {t: i for i, t in enumerate(t for t, f in df.items() if 2 <= f <= max_df)}
+    idf = np.array([math.log(n / df[t]) for t in vocab])
+
+    rows, cols, weights = [], [], []
+    for doc, c in enumerate(counts):
+        terms = [(vocab[t], f) for t, f in c.items() if t in vocab]
+        if not terms:
+            continue
+        ids = np.array([t for t, _ in terms])
+        w = (1 + np.log([f for _, f in terms])) * idf[ids]
+        if len(ids) > DESC_TERMS:
+            keep = np.argpartition(-w, DESC_TERMS - 1)[:DESC_TERMS]
+            ids, w = ids[keep], w[keep]
+        rows.append(np.full(len(ids), doc))
+        cols.append(ids)
+        weights.append(w / np.linalg.norm(w))
+    if not rows:
+        return _Postings(n, 1, np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0))
+    return _Postings(n, len(vocab), np.concatenate(rows), np.concatenate(cols), np.concatenate(weights))
+
+
+def _label_postings(labels: list) -> _Postings:
+    """Postari pentru un camp categoric (autor / serie): pondere 1, '' = fara."""
+    ids = {}
+    rows, cols = [], []
+    for doc, label in enumerate(labels):
+        if label:
+            rows.append(doc)
+            cols.append(ids.setdefault(label, len(ids)))
+    return _Postings(len(labels), max(len(ids), 1), np.array(rows, dtype=np.int64),
+                     np.array(cols, dtype=np.int64), np.ones(len(rows)))
+
+
+class SimilarityTable:
+    def __init__(self, item_ids: list, neighbors: np.ndarray, scores: np.ndarray):
+        """neighbors[i]: pozitiile vecinilor cartii i (desc. dupa scor, -1 = fara); scores[i]: scorurile lor."""
+        self.item_ids = list(item_ids)
+        self._positions = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        self.neighbors = neighbors
+        self.scores = scores
+        self.frame = None
+        self.csv_path = None
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def __contains__(self, item_id):
+        return item_id in self._positions
+
+    def similar(self, item_id: str, k: int = 10) -> list:
+        """[(item_id, scor)] pentru primii k vecini; [] pentru o carte necunoscuta."""
+        i = self._positions.get(item_id)
+        if i is None:
+            return []
+        ids = self.neighbors[i, :k]
+        return [(self.item_ids[j], float(s)) for j, s in zip(ids.tolist(), self.scores[i, :k].tolist()) if j >= 0]
+
+    # ---------- constructie ----------
+
+    @classmethod
+    def build(cls, df, genres, k: int = TOP_K, log=None) -> "SimilarityTable":
+        """
+        df: frame-ul catalogului, deja fara bookId duplicat; genres: ListColumn
+        cu aceleasi randuri. Timp: zeci de secunde pentru tot catalogul.
+        """
+        n = len(df)
+        t0 = time.perf_counter()
+        desc = description_postings(df["description"].astype(object).where(df["description"].notna(), "").tolist())
+        authors = _label_postings([primary_author(a) for a in df["author"].tolist()])
+        series = _label_postings([series_name(s) for s in df["series"].tolist()])
+
+        # genuri: vector idf normalizat; cele frecvente dense, cele rare prin postari
+        g_df = genres.doc_freq()
+        g_idf = np.log(n / np.maximum(g_df, 1))
+        g_rows = genres.row_of_each_value()
+        g_w = g_idf[genres.indices]
+        norms = np.sqrt(np.bincount(g_rows, g_w**2, minlength=n))
+        g_w = g_w / np.where(norms > 0, norms, 1)[g_rows]
+        common = g_df[genres.indices] > COMMON_GENRE_DF
+        common_ids = np.flatnonzero(g_df > COMMON_GENRE_DF)
+        dense = np.zeros((n, len(common_ids)), dtype=np.float32)
+        dense[g_rows[common], np.searchsorted(common_ids, genres.indices[common])] = g_w[common]
+        rare = _Postings(n, len(genres.vocab), g_rows[~common], genres.indices[~common].astype(np.int64), g_w[~common])
+
+        years = df["publish_year"].to_numpy(dtype="float64", na_value=np.nan)
+        if log:
+            log(f"features: {time.perf_counter() - t0:.1f} s")
+
+        shortlist = min(SHORTLIST * k, n - 1)
+        neighbors = np.full((n, k), -1, dtype=np.int32)
+        scores = np.zeros((n, k), dtype=np.float32)
+        for lo in range(0, n, BLOCK_ROWS):
+            hi = min(lo + BLOCK_ROWS, n)
+            rows = np.arange(hi - lo)
+            s = dense[lo:hi] @ dense.T
+            s *= WEIGHTS["genres"]
+            rare.add_block(s, lo, hi, WEIGHTS["genres"])
+            desc.add_block(s, lo, hi, WEIGHTS["description"])
+            authors.add_block(s, lo, hi, WEIGHTS["author"], unique=True)
+            series.add_block(s, lo, hi, WEIGHTS["series"], unique=True)
+            s[rows, lo + rows] = -1  # nu e propriul vecin
+
+            cand = np.argpartition(-s, shortlist - 1, axis=1)[:, :shortlist]
+            cand_s = s[rows[:, None], cand]
+            dy = np.abs(years[lo:hi, None] - years[cand])
+            cand_s += WEIGHTS["era"] * np.where(np.isnan(dy), 0, np.exp(-dy / ERA_SCALE_YEARS)) * (cand_s > 0)
+            top = np.argsort(-cand_s, axis=1, kind="stable")[:, :k]
+            best = cand_s[rows[:, None], top]
+            neighbors[lo:hi] = np.where(best > 0, cand[rows[:, None], top], -1)
+            scores[lo:hi] = np.where(best > 0, best, 0)
+            if log and (lo // BLOCK_ROWS) % 40 == 0:
+                log(f"{hi}/{n} carti, {time.perf_counter() - t0:.1f} s")
+        return cls(df["bookId"].astype(str).tolist(), neighbors, scores)
+
+    @classmethod
+    def from_catalog(cls, path: str | None = None, cache_dir: str | None = None, k: int = TOP_K,
+                     rebuild: bool = False, log=None) -> "SimilarityTable":
+        """Tabela din cache-ul catalogului; reconstruita (si salvata) daca lipseste sau e veche."""
+        import catalog
+
+        path = path or catalog.CSV_PATH
+        cache_dir = cache_dir or catalog.CACHE_DIR
+        df = catalog.load_catalog(path, cache_dir)
+        keep = np.flatnonzero(~df["bookId"].duplicated().to_numpy())
+        frame = df.iloc[keep]
+        sha = catalog.cache_meta(path, cache_dir).get("sha")
+
+        table = None if rebuild else cls.load(cache_dir, sha, k)
+        if table is None:
+            genres = catalog.load_lists(path, cache_dir)["genres"].take(keep)
+            table = cls.build(frame, genres, k, log=log)
+            table.save(cache_dir, sha)
+        table.frame = frame
+        table.csv_path = path
+        catalog.shared_props(path, cache_dir)
+        return table
+
+    # ---------- disc ----------
+
+    def save(self, cache_dir: str, sha: str | None):
+        import catalog
+
+        prefix = os.path.join(cache_dir, f"similar_k{self.neighbors.shape[1]}")
+        catalog.save_array(prefix + ".neighbors.npy", self.neighbors)
+        catalog.save_array(prefix + ".scores.npy", self.scores)
+        # scris ultimul: marcheaza tabela ca valida
+        catalog.save_json(prefix + ".json", {"version": SIM_VERSION, "sha": sha, "weights": WEIGHTS,
+                                             "item_ids": self.item_ids})
+
+    @classmethod
+    def load(cls, cache_dir: str, sha: str | None, k: int = TOP_K) -> "SimilarityTable | None":
+        prefix = os.path.join(cache_dir, f"similar_k{k}")
+        try:
+            with open(prefix + ".json", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if meta.get("version") != SIM_VERSION or meta.get("sha") != sha or meta.get("weights") != WEIGHTS:
+            return None
+        return cls(
+            meta["item_ids"],
+            np.load(prefix + ".neighbors.npy", mmap_mode="r"),
+            np.load(prefix + ".scores.npy", mmap_mode="r"),
+        )
+
+
+def _as_response(table, hits: list) -> dict:
+    import catalog
+
+    return catalog.as_recomms([item_id for item_id, _ in hits], table.csv_path)
+
+
+MODES = ("local", "remote", "fallback")
+
+
+def mode_from_env() -> str:
+    """SIMILAR_MODE din mediu (implicit fallback: RecommendItemsToItem, local la eroare / fara rezultate)."""
+    mode = os.environ.get("SIMILAR_MODE", "").strip().lower() or "fallback"
+    return mode if mode in MODES else "fallback"
+
+
+def recommend(table, item_id: str, count: int = 10, mode: str = "fallback", remote=None) -> dict:
+    """
+    Raspuns in forma RecommendItemsToItem ({"recomms": [{"id", "values"}]}).
+    `table`: SimilarityTable, ann_index.AnnIndex (aceleasi metode: __contains__,
+    similar, csv_path) sau None.
+
+    mode:
+      local    - doar tabela locala (remote doar daca nu stie cartea);
+      remote   - doar remote(item_id, count);
+      fallback - remote; tabela locala daca remote da eroare (timeout, 5xx)
+                 sau nu intoarce nimic.
+    """
+    if table is None or mode == "remote" or item_id not in table:
+        return remote(item_id, count)
+    if mode == "local" or remote is None:
+        return _as_response(table, table.similar(item_id, count))
+
+    try:
+        resp = remote(item_id, count)
+    except Exception:
+        resp = None
+    if resp and resp.get("recomms"):
+        return resp
+    return _as_response(table, table.similar(item_id, count))
+
+
+# ---------- tabela procesului ----------
+
+_shared = BackgroundSingleton(SimilarityTable.from_catalog, "similarity")
+
+
+def shared_table(wait: bool = True) -> SimilarityTable | None:
+    """
+    Tabela procesului: memory-mapped din cache sau construita (~1.5 min, o
+    data per CSV). Fara catalog local ramane None: doar RecommendItemsToItem.
+    """
+    return _shared.get(wait)
+
+
+def local_source():
+    """
+    Sursa locala pentru recommend(): tabela, daca e gata; altfel indexul ANN,
+    pornit abia acum (o data per proces) - cu tabela deja pe disc nu se
+    construieste deloc.
+    """
+    table = shared_table(wait=False)
+    if table is not None:
+        return table
+    import ann_index
+
+    return ann_index.shared_ann(wait=False)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Construieste tabela de carti similare (cache-ul catalogului).")
+    parser.add_argument("--k", type=int, default=TOP_K, help="vecini pastrati per carte")
+    parser.add_argument("--rebuild", action="store_true", help="reconstruieste chiar daca tabela e valida")
+    parser.add_argument("--show", default="", help="titlu (sau bookId) pentru care afisam vecinii")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    table = SimilarityTable.from_catalog(k=args.k, rebuild=args.rebuild, log=print)
+    print(f"Tabela: {len(table)} carti x {args.k} vecini, {time.perf_counter() - t0:.1f} s")
+    if args.show:
+        frame = table.frame
+        match = frame[(frame["bookId"].astype(str) == args.show) | (frame["title"] == args.show)]
+        if match.empty:
+            print(f"Nu am gasit {args.show!r}.")
+        else:
+            item_id = str(match["bookId"].iloc[0])
+            titles = dict(zip(frame["bookId"].astype(str), frame["title"]))
+            for other, score in table.similar(item_id, 10):
+                print(f"{score:.3f}  {titles[other]}")
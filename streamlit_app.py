@@ -6,24 +6,45 @@ from collections import Counter
 import streamlit as st
 from dotenv import load_dotenv
 
-from recombee_api_client.api_client import RecombeeClient, Region
 from recombee_api_client.exceptions import ResponseException
 from recombee_api_client.api_requests import (
     AddUser,
     SearchItems,
     RecommendItemsToUser,
     RecommendItemsToItem,
-    AddRating,
     SetUserValues,
-    GetItemValues,
     GetUserValues,
-    AddDetailView,
     SetItemValues
 )
 
+import autocomplete
+import event_queue
+import item_cache
+import popularity
+import recombee_client
+import search_index
+import similarity
+
+# timpul fiecarui rerun, afisat in sidebar la final
+RERUN_T0 = time.perf_counter()
+
 # ---------- env loading ----------
 ENV_PATH = Path(__file__).resolve().parent / ".env"
-load_dotenv(dotenv_path=ENV_PATH, override=True)
+
+
+def load_config() -> dict:
+    """
+    .env + setarile din el, recitit la fiecare rerun (e ieftin), ca un .env
+    reparat cat serverul ruleaza sa fie vazut imediat. Doar clientul e cache-uit.
+    """
+    load_dotenv(dotenv_path=ENV_PATH, override=True)
+    # cu RECOMBEE_LOCAL=1 mergem pe stand-in-ul local, fara credentiale
+    required = [] if recombee_client.is_local() else ["RECOMBEE_DB_ID", "RECOMBEE_API_TOKEN"]
+    return {
+        "missing": [name for name in required if not os.environ.get(name, "").strip()],
+        "region": os.environ.get("RECOMBEE_REGION", "EU_WEST").strip() or "EU_WEST",
+        "scenario": os.environ.get("SCENARIO_ID", "cli_series_boost").strip() or "cli_series_boost",
+    }
 
 
 def env_required(name: str) -> str:
@@ -34,24 +55,38 @@ def env_required(name: str) -> str:
     return v
 
 
-RECOMBEE_DB_ID = env_required("RECOMBEE_DB_ID")
-RECOMBEE_API_TOKEN = env_required("RECOMBEE_API_TOKEN")
-RECOMBEE_REGION = os.environ.get("RECOMBEE_REGION", "EU_WEST").strip() or "EU_WEST"
-SCENARIO_ID = os.environ.get("SCENARIO_ID", "cli_series_boost").strip() or "cli_series_boost"
+config = load_config()
+for name in config["missing"]:
+    env_required(name)
+RECOMBEE_REGION = config["region"]
+SCENARIO_ID = config["scenario"]
+
 
 # ---------- Recombee client ----------
-client = RecombeeClient(
-    RECOMBEE_DB_ID,
-    RECOMBEE_API_TOKEN,
-    region=Region[RECOMBEE_REGION],
-)
+@st.cache_resource
+def get_client(settings: tuple):
+    """
+    Un singur client (cu pool-ul lui de conexiuni) per proces, nu per rerun.
+    `settings` (credentialele / regiunea din .env) e cheia cache-ului: daca
+    .env se schimba, urmatorul rerun primeste un client nou.
+    """
+    client = recombee_client.make_client()
+    for attr in ("timeout", "request_timeout", "timeout_ms"):
+        if hasattr(client, attr):
+            try:
+                setattr(client, attr, 10)  # seconds
+            except Exception:
+                pass
+    return client
 
-for attr in ("timeout", "request_timeout", "timeout_ms"):
-    if hasattr(client, attr):
-        try:
-            setattr(client, attr, 10)  # seconds
-        except Exception:
-            pass
+
+client = get_client(recombee_client.client_settings())
+if search_index.mode_from_env() != "remote":
+    search_index.shared_index(wait=False)  # porneste constructia indexului local, o data per proces
+autocomplete.shared_trie(wait=False)
+if similarity.mode_from_env() != "remote":
+    similarity.shared_table(wait=False)
+popularity.shared_ranker(wait=False)
 
 
 def send_with_retry(req, tries: int = 3, base_sleep: float = 0.35):
@@ -75,12 +110,38 @@ def send_with_retry(req, tries: int = 3, base_sleep: float = 0.35):
     raise last
 
 
+# ---------- starea userului, per sesiune ----------
+# Existenta userului si valorile lui (fav_genres / fav_authors) se tin in
+# st.session_state, ca rerun-urile sa nu mai faca AddUser / GetUserValues.
+# Singurul care le scrie e aplicatia (SetUserValues), deci actualizam cache-ul
+# la scriere; TTL-ul prinde schimbarile facute din alta parte.
+USER_STATE_TTL_S = 300
+
+
+def _user_state(user_id: str) -> dict:
+    cache = st.session_state.setdefault("user_state", {})
+    state = cache.get(user_id)
+    if state is None or time.monotonic() - state["t"] > USER_STATE_TTL_S:
+        state = cache[user_id] = {"exists": None, "values": None, "t": time.monotonic()}
+    return state
+
+
+def invalidate_user_state(user_id: str):
+    st.session_state.setdefault("user_state", {}).pop(user_id, None)
+
+
 # ---------- helpers ----------
-def ensure_user(user_id: str):
+def ensure_user(user_id: str, force: bool = False):
+    state = _user_state(user_id)
+    if state["exists"] and not force:
+        return
     try:
         send_with_retry(AddUser(user_id))
+        state["exists"] = True
+        state["values"] = {}  # user nou: stim deja ca nu are valori
     except ResponseException as e:
         if e.status_code == 409:
+            state["exists"] = True
             return
         st.warning(f"AddUser warning: {e}")
 
@@ -116,7 +177,12 @@ def normalize_list(x):
 
 
 def user_values(user_id: str) -> dict:
-    return send_with_retry(GetUserValues(user_id))
+    """GetUserValues, o data per sesiune (pana la TTL sau la urmatorul SetUserValues al nostru)."""
+    state = _user_state(user_id)
+    if state["values"] is None:
+        state["values"] = send_with_retry(GetUserValues(user_id))
+        state["exists"] = True
+    return state["values"]
 
 
 def user_has_profile(user_id: str) -> bool:
@@ -147,27 +213,62 @@ def format_book(values: dict) -> str:
 
 
 def search_items(user_id: str, query: str, count: int = 10):
-    return send_with_retry(SearchItems(
-        user_id,
-        query,
-        count,
-        return_properties=True,
-        cascade_create=True,
-    ))
+    def remote(q, n):
+        return send_with_retry(SearchItems(
+            user_id,
+            q,
+            n,
+            return_properties=True,
+            cascade_create=True,
+        ))
 
+    # indexul local (construit o data per proces, in fundal); SearchItems dupa SEARCH_MODE
+    index = search_index.shared_index(wait=False)
+    resp = search_index.search(index, query, count, mode=search_index.mode_from_env(), remote=remote)
+    return item_cache.shared_cache().put_recomms(resp)
 
 
+def _use_suggestion(user_id: str, title: str, input_key: str, query_key: str, results_key: str):
+    # callback: ruleaza inainte de rerun, deci poate schimba valoarea text_input-ului
+    st.session_state[input_key] = title
+    st.session_state[query_key] = title
+    try:
+        st.session_state[results_key] = search_items(user_id, title, count=10).get("recomms", [])
+    except Exception:
+        st.session_state[results_key] = []
+
+
+def show_suggestions(user_id: str, query: str, input_key: str, query_key: str, results_key: str, k: int = 4):
+    """Sugestii din trie-ul local (tolerant la greseli) sub campul de cautare."""
+    trie = autocomplete.shared_trie(wait=False)
+    if trie is None or len(query) < 2:
+        return
+    suggestions = trie.suggest(query, k=k)
+    if not suggestions:
+        return
+    st.caption("Ai vrut să spui:" if suggestions[0]["distance"] else "Sugestii:")
+    for col, sug in zip(st.columns(len(suggestions)), suggestions):
+        col.button(
+            autocomplete.suggestion_label(sug),
+            key=f"{input_key}_sug_{sug['id']}",
+            on_click=_use_suggestion,
+            args=(user_id, sug["title"], input_key, query_key, results_key),
+        )
+
+
+# vizitele si rating-urile intra in coada write-behind a procesului:
+# butonul raspunde imediat, trimiterea se face in fundal, in Batch
 def add_detail_view(user_id: str, item_id: str):
-    send_with_retry(AddDetailView(user_id, item_id, cascade_create=True))
+    event_queue.shared_queue(client).add_detail_view(user_id, item_id)
 
 
 def rate_item(user_id: str, item_id: str, stars_1_to_5: float):
     r = (stars_1_to_5 - 3) / 2
-    send_with_retry(AddRating(user_id, item_id, r, cascade_create=True))
+    event_queue.shared_queue(client).add_rating(user_id, item_id, r)
 
 
 def recommend_for_user(user_id: str, count: int = 10):
-    return send_with_retry(
+    resp = send_with_retry(
         RecommendItemsToUser(
             user_id,
             count,
@@ -175,25 +276,62 @@ def recommend_for_user(user_id: str, count: int = 10):
             scenario=SCENARIO_ID,
         )
     )
+    return item_cache.shared_cache().put_recomms(resp)
+
+
+def popular_books(count: int = 10, genre: str | None = None, genres: list | None = None):
+    """
+    Cele mai apreciate carti, din clasamentul local, fara retea: global, dintr-un
+    gen sau intercalate din mai multe (ex. fav_genres).
+    """
+    ranker = popularity.shared_ranker(wait=False)
+    if ranker is None:
+        return {"recomms": []}
+    if genres:
+        resp = popularity.popular_for_genres(ranker, genres, count)
+    else:
+        resp = popularity.popular(ranker, count, genre=genre)
+    return item_cache.shared_cache().put_recomms(resp)
+
+
+def show_popular(count: int = 10, genre: str | None = None, genres: list | None = None):
+    recomms = popular_books(count, genre, genres).get("recomms", [])
+    for i, rec in enumerate(recomms, start=1):
+        st.write(f"{i}. {format_book(rec.get('values', {}))}  \n`{rec.get('id')}`")
 
 
 def recommend_similar(user_id: str, item_id: str, count: int = 10):
-    return send_with_retry(
-        RecommendItemsToItem(
-            item_id,
-            user_id,
-            count,
-            return_properties=True,
+    mode = similarity.mode_from_env()
+
+    def remote(i, n):
+        # in fallback nu mai asteptam retry-urile: tabela locala raspunde imediat
+        return send_with_retry(
+            RecommendItemsToItem(
+                i,
+                user_id,
+                n,
+                return_properties=True,
+            ),
+            tries=1 if mode == "fallback" else 3,
         )
-    )
+
+    # tabela precalculata; pana e gata, candidatii vin din indexul ANN peste descrieri
+    local = None if mode == "remote" else similarity.local_source()
+    resp = similarity.recommend(local, item_id, count, mode=mode, remote=remote)
+    return item_cache.shared_cache().put_recomms(resp)
 
 
 def init_user_profile_from_3_books(user_id: str, item_ids: list[str]) -> bool:
     fav_genres = []
     fav_authors = []
 
+    # cartile au fost afisate in cautare, deci de obicei sunt deja in cache;
+    # restul vin intr-un singur Batch
+    values_by_id = item_cache.get_many_item_values(send_with_retry, item_ids)
     for item_id in item_ids:
-        values = send_with_retry(GetItemValues(item_id))
+        values = values_by_id.get(item_id)
+        if values is None:
+            continue
         author = values.get("author")
         genres = values.get("genres") or []
 
@@ -225,15 +363,20 @@ def init_user_profile_from_3_books(user_id: str, item_ids: list[str]) -> bool:
     if not fav_genres and not fav_authors:
         return False
 
-    send_with_retry(
-        SetUserValues(
-            user_id,
-            {
-                "fav_genres": fav_genres,
-                "fav_authors": fav_authors,
-            },
-        )
-    )
+    new_values = {
+        "fav_genres": fav_genres,
+        "fav_authors": fav_authors,
+    }
+    try:
+        send_with_retry(SetUserValues(user_id, new_values))
+    except Exception:
+        invalidate_user_state(user_id)  # nu stim ce a ajuns pe server
+        raise
+
+    # SetUserValues suprascrie doar cheile trimise, deci cache-ul ramane exact
+    state = _user_state(user_id)
+    if state["values"] is not None:
+        state["values"] = {**state["values"], **new_values}
     return True
 
 def display_user_profile_summary(user_id: str, top_genres: int = 8):
@@ -283,12 +426,14 @@ with st.sidebar:
 
     st.caption(f"Scenario: `{SCENARIO_ID}`")
 
-    st.caption(f"Region: `{RECOMBEE_REGION}`")
+    st.caption(f"Region: `{'local' if recombee_client.is_local() else RECOMBEE_REGION}`")
 
     if st.button("👤 Creează/Asigură user în Recombee", disabled=(not uid)):
-        ensure_user(uid)
+        ensure_user(uid, force=True)
         st.success("OK (user există)")
 
+    rerun_slot = st.empty()  # completat la final, cu durata rerun-ului
+
 if not st.session_state["user_id"]:
     st.info("Introdu un User ID în sidebar ca să începi.")
     st.stop()
@@ -335,6 +480,7 @@ with tab_cold:
             key="cold_query_input",
         ).strip()
         st.session_state["cold_query"] = cold_q
+        show_suggestions(user_id, cold_q, "cold_query_input", "cold_query", "cold_results")
 
         if st.button("🔍 Caută pentru profil", key="cold_search_btn"):
             if not cold_q:
@@ -348,6 +494,13 @@ with tab_cold:
                     st.error(f"SearchItems error: {e}")
                     st.session_state["cold_results"] = []
 
+        ranker = popularity.shared_ranker(wait=False)
+        if ranker is not None:
+            pop_genre = st.selectbox("…sau alege dintre cele mai apreciate cărți dintr-un gen",
+                                     ranker.genres(), key="cold_genre_select")
+            if st.button("📈 Populare în gen", key="cold_popular_btn"):
+                st.session_state["cold_results"] = popular_books(10, pop_genre).get("recomms", [])
+
         cold_results = st.session_state["cold_results"]
 
         if cold_results:
@@ -400,6 +553,7 @@ with tab_search:
 
     q = st.text_input("Caută titlu", value=st.session_state["search_query"], key="search_q").strip()
     st.session_state["search_query"] = q
+    show_suggestions(user_id, q, "search_q", "search_query", "search_results")
 
     if st.button("🔍 Caută", key="search_btn"):
         if not q:
@@ -468,12 +622,16 @@ with tab_recs:
         if needs_profile:
             st.error("Nu ai profil încă (fav_genres / fav_authors gol). "
                  "Mergi la tab-ul ❄️ Cold start și alege 3 cărți, apoi salvează profilul.")
+            st.markdown("Până atunci, cele mai apreciate cărți:")
+            show_popular(int(count))
             st.stop()
         try:
             resp = recommend_for_user(user_id, int(count))
             recomms = resp.get("recomms", [])
             if not recomms:
                 st.warning("Nu există destule informații încă. (mai multe view-uri / rating-uri ajută)")
+                st.markdown("Până atunci, cele mai apreciate cărți din genurile tale:")
+                show_popular(int(count), genres=normalize_list(user_values(user_id).get("fav_genres")))
             else:
                 for i, rec in enumerate(recomms, start=1):
                     st.write(f"{i}. {format_book(rec.get('values', {}))}  \n`{rec.get('id')}`")
@@ -504,3 +662,12 @@ with tab_sim:
                         st.write(f"{i}. {format_book(rec.get('values', {}))}  \n`{rec.get('id')}`")
             except Exception as e:
                 st.error(f"Eroare la recomandări similare: {e}")
+
+# ---------- durata rerun-ului ----------
+rerun_ms = (time.perf_counter() - RERUN_T0) * 1000
+history = st.session_state.setdefault("rerun_ms", [])
+history.append(rerun_ms)
+del history[:-20]
+rerun_slot.caption(
+    f"Rerun: `{rerun_ms:.1f} ms` (mediana ultimelor {len(history)}: `{sorted(history)[len(history) // 2]:.1f} ms`)"
+)